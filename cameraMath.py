@@ -0,0 +1,272 @@
+"""Camera vector math for one or many cameras at once.
+
+The batched functions take arrays whose last axis holds x, y, z so N
+cameras or N angles are handled in one call without Python loops. This
+module does not use abaqus so it may be tested and timed outside of CAE.
+rotateVector was moved here from views.py; run this file to check the
+batched functions against it and time them.
+
+vim: set modeline foldmethod=indent fdn=1:
+$Id$
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    # Abaqus versions < 6.10-ef use the older Numeric module.
+    import Numeric as np
+
+    def cross(a, b):
+        " Vector cross product as in Matlab "
+        a = np.asarray(a)
+        b = np.asarray(b)
+        c = np.array([ a[...,1]*b[...,2] - a[...,2]*b[...,1],
+                       a[...,2]*b[...,0] - a[...,0]*b[...,2],
+                       a[...,0]*b[...,1] - a[...,1]*b[...,0] ])
+        # move the component axis last
+        return np.transpose(c, range(1, len(c.shape)) + [0])
+    np.cross = cross
+
+def norm(v):
+    " Vector length as in Matlab "
+    return np.sqrt(np.sum(v*v, axis=-1))
+
+def rotateVector(point, vector, th):
+    """Calculate rotation of "point" around arbitrary "vector" by radian angle "th".
+
+    http://www.mines.edu/~gmurray/ArbitraryAxisRotation/ArbitraryAxisRotation.html
+    """
+    x, y, z = point
+    u, v, w = vector
+    a = np.array([ [x*(v*v + w*w) - u*(v*y + w*z), -w*y + v*z],
+                   [y*(u*u + w*w) - v*(u*x + w*z),  w*x - u*z],
+                   [z*(u*u + v*v) - w*(u*x + v*y), -v*x + u*y] ])
+    a = vector*np.sum(point*vector) + \
+            np.dot(a, [np.cos(th), norm(vector)*np.sin(th)])
+    return a/np.sum(vector*vector)
+
+def column(a):
+    " Append an axis of length 1 so a broadcasts against vectors "
+    a = np.asarray(a, 'd')
+    return np.reshape(a, np.shape(a) + (1,))
+
+def normalize(v):
+    " Return v scaled to unit length along the last axis "
+    v = np.asarray(v, 'd')
+    return v/column(norm(v))
+
+def rotateVectors(points, axes, angles):
+    """Rotate points around axes through the origin by radian angles.
+
+    Arguments broadcast against each other, for example one point and
+    axis with N angles or N points with one axis and angle.
+    """
+    points = np.asarray(points, 'd')
+    axes = normalize(axes)
+    c = column(np.cos(angles))
+    s = column(np.sin(angles))
+    along = column(np.sum(points*axes, axis=-1))*axes
+    return points*c + np.cross(axes, points)*s + along*(1 - c)
+
+def orbit(positions, targets, axes, angles):
+    " Return camera positions rotated around axes through their targets "
+    targets = np.asarray(targets, 'd')
+    return targets + rotateVectors(
+            np.asarray(positions, 'd') - targets, axes, angles)
+
+def pan(positions, targets, vectors):
+    " Return positions and targets shifted by vectors in model coordinates "
+    vectors = np.asarray(vectors, 'd')
+    return np.asarray(positions, 'd') + vectors, \
+            np.asarray(targets, 'd') + vectors
+
+def flip(positions, targets):
+    " Return camera positions looking from behind the targets "
+    return 2*np.asarray(targets, 'd') - np.asarray(positions, 'd')
+
+def cutNormal(positions, targets, normals, axis2s):
+    """Return camera positions and up vectors looking along cut normals
+
+    The distance from each target is unchanged as in views.viewCutNormal.
+    """
+    targets = np.asarray(targets, 'd')
+    normals = np.asarray(normals, 'd')
+    dist = column(norm(np.asarray(positions, 'd') - targets))
+    return targets + dist*normalize(normals), np.cross(normals, axis2s)
+
+def cameraQuaternion(position, target, up):
+    """Return unit quaternion (w, x, y, z) of the camera orientation
+
+    The rotation maps x, y, z to the camera right, up and back directions.
+    """
+    back = normalize(np.asarray(position, 'd') - np.asarray(target, 'd'))
+    right = normalize(np.cross(up, back))
+    up = np.cross(back, right)
+    m = np.transpose(np.array([right, up, back]))   # columns
+    trace = m[0][0] + m[1][1] + m[2][2]
+    if trace > 0:
+        s = 2*np.sqrt(trace + 1)
+        q = (0.25*s, (m[2][1] - m[1][2])/s, (m[0][2] - m[2][0])/s,
+                (m[1][0] - m[0][1])/s)
+    elif m[0][0] > m[1][1] and m[0][0] > m[2][2]:
+        s = 2*np.sqrt(1 + m[0][0] - m[1][1] - m[2][2])
+        q = ((m[2][1] - m[1][2])/s, 0.25*s, (m[0][1] + m[1][0])/s,
+                (m[0][2] + m[2][0])/s)
+    elif m[1][1] > m[2][2]:
+        s = 2*np.sqrt(1 + m[1][1] - m[0][0] - m[2][2])
+        q = ((m[0][2] - m[2][0])/s, (m[0][1] + m[1][0])/s, 0.25*s,
+                (m[1][2] + m[2][1])/s)
+    else:
+        s = 2*np.sqrt(1 + m[2][2] - m[0][0] - m[1][1])
+        q = ((m[1][0] - m[0][1])/s, (m[0][2] + m[2][0])/s,
+                (m[1][2] + m[2][1])/s, 0.25*s)
+    return np.array(q)
+
+def slerp(q0, q1, t):
+    " Spherical interpolation between arrays of unit quaternions "
+    q0 = np.asarray(q0, 'd')
+    q1 = np.asarray(q1, 'd')
+    dot = np.sum(q0*q1, axis=-1)
+    q1 = q1*column(np.where(dot < 0, -1.0, 1.0))   # take the short way
+    dot = np.clip(abs(dot), 0.0, 1.0)
+    theta = np.arccos(dot)
+    sinTheta = np.sin(theta)
+    small = sinTheta < 1e-6     # nearly identical; use linear interpolation
+    sinTheta = np.where(small, 1.0, sinTheta)
+    w0 = np.where(small, 1 - t, np.sin((1 - t)*theta)/sinTheta)
+    w1 = np.where(small, t, np.sin(t*theta)/sinTheta)
+    return normalize(q0*column(w0) + q1*column(w1))
+
+def quaternionAxes(q):
+    " Return camera back and up directions of an array of quaternions "
+    w, x, y, z = [q[...,i] for i in range(4)]
+    up = np.array([2*(x*y - w*z), 1 - 2*(x*x + z*z), 2*(y*z + w*x)])
+    back = np.array([2*(x*z + w*y), 2*(y*z - w*x), 1 - 2*(x*x + y*y)])
+    order = range(1, len(up.shape)) + [0]  # move the component axis last
+    return np.transpose(back, order), np.transpose(up, order)
+
+def cameraPath(cameras, frames):
+    """Return frames x 10 array of interpolated cameras
+
+    Each camera is (position, target, up, width) and each row of the
+    result is position, target, up and width. Orientation is interpolated
+    by slerp, targets by a Catmull-Rom spline and the target distance and
+    width geometrically so zooming is steady.
+    """
+    count = len(cameras)
+    if count < 2 or frames < 2:
+        raise ValueError('Need at least two cameras and two frames')
+    positions = np.array([camera[0] for camera in cameras], 'd')
+    targets = np.array([camera[1] for camera in cameras], 'd')
+    quats = np.array([cameraQuaternion(*camera[:3]) for camera in cameras])
+    distances = norm(positions - targets)
+    widths = np.array([camera[3] for camera in cameras], 'd')
+
+    # Keyframe segment and fraction of each frame
+    u = np.arange(frames)*((count - 1)/(frames - 1.0))
+    i = np.minimum(np.floor(u).astype('i'), count - 2)
+    t = u - i
+    tc = column(t)
+
+    # Catmull-Rom with the end targets repeated
+    padded = np.concatenate((targets[:1], targets, targets[-1:]))
+    p0, p1, p2, p3 = [np.take(padded, i + k, axis=0) for k in range(4)]
+    target = 0.5*(2*p1 + (p2 - p0)*tc + (2*p0 - 5*p1 + 4*p2 - p3)*tc*tc +
+            (3*p1 - p0 - 3*p2 + p3)*tc*tc*tc)
+
+    d0, d1 = np.take(distances, i), np.take(distances, i + 1)
+    w0, w1 = np.take(widths, i), np.take(widths, i + 1)
+    distance = d0*(d1/d0)**t
+    width = w0*(w1/w0)**t
+
+    q = slerp(np.take(quats, i, axis=0), np.take(quats, i + 1, axis=0), t)
+    back, up = quaternionAxes(q)
+    position = target + back*column(distance)
+    return np.concatenate((position, target, up, column(width)), axis=-1)
+
+def turntablePath(camera, frames, axis=None):
+    """Return frames x 10 array orbiting camera once around its target
+
+    The default axis is the camera up vector.
+    """
+    position, target, up, width = camera
+    if axis is None:
+        axis = up
+    angles = np.arange(frames)*(2*np.pi/frames)
+    count = len(angles)
+    positions = orbit(position, target, axis, angles)
+    ups = rotateVectors(up, axis, angles)
+    targets = np.resize(np.asarray(target, 'd'), (count, 3))
+    widths = np.resize(np.asarray([width], 'd'), (count, 1))
+    return np.concatenate((positions, targets, ups, widths), axis=-1)
+
+
+if __name__ == '__main__':  # Check and time the batched functions
+    import time
+    count = 10000
+    position = np.array([10.0, 2.0, 5.0])
+    target = np.array([1.0, 1.0, 1.0])
+    up = np.array([0.0, 1.0, 0.0])
+    angles = np.arange(count)*(2*np.pi/count)
+
+    start = time.time()
+    scalar = [target + rotateVector(position - target, up, th)
+            for th in angles]
+    scalarTime = time.time() - start
+
+    start = time.time()
+    batched = orbit(position, target, up, angles)
+    batchedTime = time.time() - start
+
+    error = np.maximum.reduce(np.ravel(abs(np.array(scalar) - batched)))
+    print "orbit %d cameras: scalar %.1f ms, batched %.2f ms (%.0fx faster)"%(
+            count, 1e3*scalarTime, 1e3*batchedTime, scalarTime/batchedTime)
+    print "max difference %.2g"%error
+    assert error < 1e-9, "batched orbit differs from rotateVector"
+    quarter = rotateVector(np.array([1.0, 0.0, 0.0]), up, np.pi/2)
+    assert norm(quarter - [0.0, 0.0, -1.0]) < 1e-12, quarter
+
+    cameras = [(position, target, up, 100.0),
+            (flip(position, target), target + 1, up, 50.0),
+            (position, target, np.array([0.0, 0.0, 1.0]), 100.0)]
+    start = time.time()
+    path = cameraPath(cameras, count + 1)
+    pathTime = time.time() - start
+    print "cameraPath %d frames: %.2f ms"%(count + 1, 1e3*pathTime)
+
+    def uprightUp(camera):
+        " Return the unit up vector perpendicular to the view direction "
+        back = normalize(camera[0] - camera[1])
+        return normalize(np.cross(back, np.cross(camera[2], back)))
+
+    for row, camera in ((0, cameras[0]), (count//2, cameras[1]),
+            (count, cameras[2])):
+        # Frames on the keyframes show the keyframe camera
+        assert norm(path[row][0:3] - camera[0]) < 1e-9, (row, path[row])
+        assert norm(path[row][3:6] - camera[1]) < 1e-9, (row, path[row])
+        assert norm(path[row][6:9] - uprightUp(camera)) < 1e-9, \
+                (row, path[row])
+        assert abs(path[row][9] - camera[3]) < 1e-9, (row, path[row])
+    ups = path[:,6:9]
+    backs = normalize(path[:,0:3] - path[:,3:6])
+    assert max(abs(norm(ups) - 1)) < 1e-9, "up vectors are not unit length"
+    assert max(abs(np.sum(ups*backs, axis=-1))) < 1e-9, \
+            "up vectors are not perpendicular to the view direction"
+    assert min(path[:,9]) >= 50.0 and max(path[:,9]) <= 100.0, \
+            "widths overshoot the keyframes"
+
+    frames = 36
+    path = turntablePath((position, target, up, 100.0), frames)
+    offsets = path[:,0:3] - path[:,3:6]
+    assert norm(path[0][0:3] - position) < 1e-9, path[0]
+    assert max(abs(norm(offsets) - norm(position - target))) < 1e-9, \
+            "turntable changes the target distance"
+    assert max(abs(np.sum(offsets*up, axis=-1) -
+            np.sum((position - target)*up))) < 1e-9, \
+            "turntable leaves the plane of the orbit"
+    assert norm(path[frames//2][0:3] - flip(position, target) -
+            2*np.sum((position - target)*up)*up) < 1e-9, \
+            "half a turn is not behind the target"
+    assert max(norm(path[:,6:9] - up)) < 1e-9, "up vector changes"
+    assert max(abs(path[:,9] - 100.0)) < 1e-9, "width changes"
+    print "cameraPath and turntablePath checks passed"
@@ -0,0 +1,323 @@
+"""Content-addressed cache of small png thumbnails of saved userViews
+
+Thumbnails are stored once per sha1 digest of their bytes and an index
+maps each view id to its digest, so identical images share one file. View
+ids are only unique within one database so each database has its own
+index, named after a digest of its absolute path. The kernel adds
+thumbnails while the GUI reads them; both see changes because the index
+is replaced atomically and reloaded when its time stamp changes.
+Recently used thumbnails are kept in memory up to memoryLimit bytes.
+
+This module does not use abaqus.
+
+$Id$
+"""
+
+import os
+import sys
+import time
+import zlib
+import struct
+import marshal
+import hashlib
+import threading
+import viewEmbed
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict  # Python < 2.7 evicts in arbitrary order
+
+indexName = 'index'
+
+
+def databaseIndex(database):    # {{{1
+    "Return the index file name of the thumbnails of database"
+    path = os.path.normcase(os.path.abspath(database))
+    return '%s-%s'%(indexName, hashlib.sha1(path).hexdigest()[:16])
+
+
+def replaceFile(fileName, data):    # {{{1
+    "Write data to fileName so that readers never see a partial file"
+    tempName = '%s.%d.tmp'%(fileName, os.getpid())
+    f = open(tempName, 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    if os.name == 'nt' and os.path.exists(fileName):
+        os.remove(fileName)     # rename cannot replace on Windows
+    os.rename(tempName, fileName)
+
+
+class thumbCache:   # {{{1
+    "Thumbnail png data by view id of the userViews database file"
+
+    def __init__(self, directory, database, memoryLimit=1 << 22):
+        self.directory = directory
+        self.database = database
+        self.indexFile = os.path.join(directory, databaseIndex(database))
+        self.memoryLimit = memoryLimit
+        self.memory = OrderedDict()     # digest: png data, oldest first
+        self.memorySize = 0
+        self.index = {}     # view id: digest
+        self.indexStamp = None
+        self.lock = threading.Lock()    # the rebuild thread also writes
+
+    def path(self, digest):
+        "Return the file name of the thumbnail with the given digest"
+        return os.path.join(self.directory, digest[:2], digest[2:] + '.png')
+
+    def loadIndex(self):
+        "Read the index again if another process has replaced it"
+        try:
+            stat = os.stat(self.indexFile)
+        except OSError:
+            return
+        stamp = (stat.st_size, stat.st_mtime)
+        if stamp == self.indexStamp:
+            return
+        try:
+            f = open(self.indexFile, 'rb')
+            try:
+                self.index = marshal.load(f)
+            finally:
+                f.close()
+            self.indexStamp = stamp
+        except (IOError, EOFError, ValueError, TypeError):
+            pass    # being replaced; try again next time
+
+    def has(self, viewId):
+        "Return True if there is a thumbnail for viewId"
+        self.loadIndex()
+        return self.index.has_key(viewId)
+
+    def get(self, viewId):
+        "Return png data of the thumbnail for viewId or None"
+        self.loadIndex()
+        digest = self.index.get(viewId)
+        if not digest:
+            return None
+        data = self.memory.pop(digest, None)
+        if data is None:
+            try:
+                f = open(self.path(digest), 'rb')
+                try:
+                    data = f.read()
+                finally:
+                    f.close()
+            except IOError:
+                return None
+            self.memorySize += len(data)
+        self.memory[digest] = data  # most recently used
+        while self.memorySize > self.memoryLimit and len(self.memory) > 1:
+            if OrderedDict is dict:
+                digest, old = self.memory.popitem()
+            else:
+                digest, old = self.memory.popitem(last=False)
+            self.memorySize -= len(old)
+        return data
+
+    def put(self, viewId, data):
+        "Store png data as the thumbnail of viewId; return its digest"
+        digest = hashlib.sha1(data).hexdigest()
+        fileName = self.path(digest)
+        self.lock.acquire()
+        try:
+            if not os.path.exists(fileName):
+                if not os.path.isdir(os.path.dirname(fileName)):
+                    os.makedirs(os.path.dirname(fileName))
+                replaceFile(fileName, data)
+            self.loadIndex()
+            self.index[viewId] = digest
+            replaceFile(self.indexFile, marshal.dumps(self.index))
+            self.indexStamp = None  # reload to pick up the new stamp
+        finally:
+            self.lock.release()
+        return digest
+
+
+def imageData(f, chunks):   # {{{1
+    "Yield the decompressed data of the IDAT chunks of png file f"
+    decompressor = zlib.decompressobj()
+    for offset, chunkSize, chunkType, crc, isView in chunks:
+        if 'IDAT' == chunkType:
+            f.seek(offset + 8)
+            data = f.read(chunkSize - 12)
+            while data:
+                yield decompressor.decompress(data, 1 << 16)
+                data = decompressor.unconsumed_tail
+    yield decompressor.flush()  # the end of the last rows
+
+
+def pngThumbnail(fileName, size=(160, 120)):   # {{{1
+    """Return png data of fileName scaled down to fit within size
+
+    Only 8 bit, non-interlaced gray, RGB and RGBA images are supported;
+    None is returned for others. Rows are decompressed one at a time so
+    memory use does not depend on the image size. Only the sampled rows
+    and the rows they depend on through their filters are unfiltered, and
+    decompression stops after the last sampled row.
+    """
+    f = open(fileName, 'rb')
+    try:
+        chunks = viewEmbed.scanChunks(f)
+        if not chunks or 'IHDR' != chunks[0][2]:
+            return None
+        f.seek(chunks[0][0] + 8)
+        width, height, depth, colorType, compression, filterMethod, \
+                interlace = struct.unpack('>IIBBBBB', f.read(13))
+        channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(colorType)
+        if 8 != depth or interlace or not channels or not height:
+            return None
+        scale = max(float(width)/size[0], float(height)/size[1], 1.0)
+        thumbWidth = max(1, int(width/scale))
+        thumbHeight = max(1, int(height/scale))
+        sampleRows = set([int(r*scale) for r in range(thumbHeight)])
+        sampleColumns = [int(c*scale)*channels for c in range(thumbWidth)]
+        rowSize = 1 + width*channels
+        prior = bytearray(rowSize - 1)  # last unfiltered row
+        chain = []  # (filter type, row) still filtered, following prior
+        rowNumber = 0
+        rows = []   # sampled rows of RGB pixels
+        pending = ''
+        for data in imageData(f, chunks):
+            pending += data
+            pos = 0
+            while len(pending) - pos >= rowSize and \
+                    len(rows) < thumbHeight:
+                filterType = ord(pending[pos])
+                if filterType < 2:
+                    chain = []  # None and Sub do not use the prior row
+                chain.append( (filterType,
+                    bytearray(pending[pos + 1:pos + rowSize])) )
+                pos += rowSize
+                if rowNumber in sampleRows:
+                    for filterType, row in chain:
+                        prior = unfilter(row, prior, filterType, channels)
+                    chain = []
+                    rows.append(samplePixels(prior, sampleColumns, channels))
+                    time.sleep(0)   # let other threads, such as the kernel, run
+                rowNumber += 1
+            pending = pending[pos:]
+            if len(rows) == thumbHeight:
+                break   # the rest of the image is not sampled
+    finally:
+        f.close()
+    if not rows:
+        return None
+    raw = ''.join(['\0' + str(row) for row in rows])
+    return viewEmbed.pngSignature + \
+            viewEmbed.encodeChunk('IHDR', struct.pack('>IIBBBBB',
+                len(rows[0])//3, len(rows), 8, 2, 0, 0, 0)) + \
+            viewEmbed.encodeChunk('IDAT', zlib.compress(raw)) + \
+            viewEmbed.iendChunk
+
+
+def unfilter(row, prior, filterType, bpp):    # {{{1
+    "Undo the png filter of row in place given the previous row"
+    n = len(row)
+    if 1 == filterType:     # Sub
+        for i in xrange(bpp, n):
+            row[i] = (row[i] + row[i - bpp]) & 0xff
+    elif 2 == filterType:   # Up
+        row = bytearray([(a + b) & 0xff for a, b in zip(row, prior)])
+    elif 3 == filterType:   # Average
+        for i in xrange(n):
+            left = i >= bpp and row[i - bpp] or 0
+            row[i] = (row[i] + ((left + prior[i]) >> 1)) & 0xff
+    elif 4 == filterType:   # Paeth
+        for i in xrange(n):
+            if i >= bpp:
+                a = row[i - bpp]
+                c = prior[i - bpp]
+            else:
+                a = c = 0
+            b = prior[i]
+            p = a + b - c
+            pa = abs(p - a)
+            pb = abs(p - b)
+            pc = abs(p - c)
+            if pa <= pb and pa <= pc:
+                predictor = a
+            elif pb <= pc:
+                predictor = b
+            else:
+                predictor = c
+            row[i] = (row[i] + predictor) & 0xff
+    return row
+
+
+def samplePixels(row, columns, channels):   # {{{1
+    "Return bytearray of RGB values at the byte offsets columns of row"
+    pixels = bytearray()
+    for c in columns:
+        if channels < 3:
+            pixels.extend((row[c], row[c], row[c]))     # gray
+        else:
+            pixels.extend(row[c:c + 3])
+    return pixels
+
+
+def makeThumbnail(cache, viewId, fileName, size=(160, 120)):    # {{{1
+    "Add the thumbnail of png fileName for viewId; return True if made"
+    try:
+        data = pngThumbnail(fileName, size)
+    except (IOError, ValueError, zlib.error):
+        return False
+    if not data:
+        return False
+    cache.put(viewId, data)
+    return True
+
+
+def hasView(fileName):  # {{{1
+    "Return True if png fileName has an embedded userView"
+    f = open(fileName, 'rb')
+    try:
+        return bool([chunk for chunk in viewEmbed.scanChunks(f) if chunk[4]])
+    finally:
+        f.close()
+
+
+def startThread(run, name):     # {{{1
+    "Run function run on a daemon thread; return the thread"
+    thread = threading.Thread(target=run, name=name)
+    thread.setDaemon(True)
+    thread.start()
+    return thread
+
+
+def rebuild(cache, candidates, size=(160, 120)):   # {{{1
+    """Start a background thread creating missing thumbnails
+
+    candidates is a list of (view id, png file name) of views the Views
+    Manager is showing; views which already have a thumbnail are skipped
+    and only files with an embedded userView are used. All file access is
+    on the thread. Return the thread.
+    """
+    def run():
+        made = 0
+        for viewId, fileName in candidates:
+            if cache.has(viewId) or not os.path.exists(fileName):
+                continue
+            try:
+                if not hasView(fileName):
+                    continue
+            except (IOError, ValueError):
+                continue
+            if makeThumbnail(cache, viewId, fileName, size):
+                made += 1
+        if made:
+            print "Created %d view thumbnails"%made
+    return startThread(run, 'thumbnail rebuild')
+
+
+if __name__ == '__main__':  # {{{1 Time creating a thumbnail
+    if len(sys.argv) != 2:
+        sys.exit('Usage: thumbCache.py image.png')
+    start = time.time()
+    data = pngThumbnail(sys.argv[1])
+    if data is None:
+        sys.exit('Unsupported png format')
+    print "%d byte thumbnail in %.2f s"%(len(data), time.time() - start)
+    open('thumbnail.png', 'wb').write(data)
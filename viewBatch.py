@@ -0,0 +1,227 @@
+"""Print saved userViews for many odbs using parallel Abaqus/Viewer sessions
+
+Usage: python viewBatch.py [options] job1.odb job2.odb ...
+
+Each odb is opened by its own "abaqus viewer noGUI" worker which restores
+every selected view and prints it to PNG in a directory named after the
+odb and its path below the directory common to all the odbs. The scheduling in this module is plain Python; run with --stub to
+exercise it without Abaqus. The same file is the worker script when
+Abaqus runs it with --worker.
+
+$Id$
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import tempfile
+import traceback
+import subprocess
+from optparse import OptionParser
+from multiprocessing.pool import ThreadPool
+import viewsCommon
+
+scriptName = os.path.abspath(__file__)
+if scriptName.endswith('.pyc'):
+    scriptName = scriptName[:-1]
+
+
+def jobDirectories(outputDir, odbNames):   # {{{1
+    """Return the directory for images of each odb
+
+    The directories mirror the odb paths below their common directory so
+    odbs with the same name in different directories do not share one.
+    """
+    paths = [os.path.splitext(os.path.abspath(odbName))[0]
+            for odbName in odbNames]
+    parts = [os.path.dirname(path).split(os.sep) for path in paths]
+    common = parts[0]
+    for other in parts[1:]:
+        while other[:len(common)] != common:
+            common = common[:-1]
+    directories = []
+    for path in paths:
+        relative = os.sep.join(path.split(os.sep)[len(common):])
+        relative = os.path.splitdrive(relative)[1].lstrip(os.sep)
+        directories.append(os.path.join(outputDir, relative))
+    return directories
+
+
+def newResult(job):    # {{{1
+    "Return empty result dictionary for job"
+    return {'odb': job['odb'], 'views': [], 'seconds': 0.0, 'error': None}
+
+
+def abaqusWorker(job, command='abaqus'):    # {{{1
+    "Run one job in an Abaqus/Viewer noGUI process and return its result"
+    result = newResult(job)
+    handle, resultName = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    os.remove(resultName)   # the worker creates it when done
+    args = [command, 'viewer', 'noGUI=%s'%scriptName, '--', '--worker',
+            resultName, job['viewFile'], job['directory'], job['odb'],
+            job['name']]
+    log = open(os.path.join(job['directory'], 'viewBatch.log'), 'w')
+    try:
+        start = time.time()
+        # abaqus is a batch file on Windows so it needs the shell there
+        status = subprocess.call(args, stdout=log, stderr=subprocess.STDOUT,
+                cwd=job['directory'], shell=(os.name == 'nt'))
+        result['seconds'] = time.time() - start
+    finally:
+        log.close()
+    if os.path.exists(resultName):
+        f = open(resultName)
+        try:
+            result.update(json.load(f))
+        finally:
+            f.close()
+        os.remove(resultName)
+    elif status:
+        result['error'] = 'exit status %d, see %s'%(status, log.name)
+    else:
+        result['error'] = 'no result, see %s'%log.name
+    return result
+
+
+def stubWorker(job):    # {{{1
+    "Pretend to print views so the scheduler can be tested without Abaqus"
+    result = newResult(job)
+    start = time.time()
+    time.sleep(random.uniform(0.05, 0.2))
+    if 'fail' in os.path.basename(job['odb']):
+        result['error'] = 'stub failure'
+    else:
+        result['views'] = [ (str(i), os.path.join(job['directory'],
+            'view-%d'%i), 0.01) for i in range(3) ]
+    result['seconds'] = time.time() - start
+    return result
+
+
+def runJobs(jobs, worker, processes):    # {{{1
+    "Run jobs with at most processes workers; return results in job order"
+    def run(index):
+        job = jobs[index]
+        try:
+            result = worker(job)
+        except Exception:
+            result = newResult(job)
+            result['error'] = traceback.format_exc()
+        return index, result
+
+    results = [None]*len(jobs)
+    pool = ThreadPool(processes)    # each thread waits on its own process
+    try:
+        for done, (index, result) in enumerate(
+                pool.imap_unordered(run, range(len(jobs)))):
+            results[index] = result
+            status = result['error'] and 'FAILED' or 'ok'
+            print "%d/%d %s %s (%.1f s)"%(done + 1, len(jobs),
+                    result['odb'], status, result['seconds'])
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def report(results, stream=sys.stdout):  # {{{1
+    "Write a summary table of results and the failure messages"
+    width = max([len(result['odb']) for result in results] + [3])
+    stream.write('%-*s %6s %9s  status\n'%(width, 'odb', 'views', 'seconds'))
+    for result in results:
+        stream.write('%-*s %6d %9.1f  %s\n'%(width, result['odb'],
+            len(result['views']), result['seconds'],
+            result['error'] and 'FAILED' or 'ok'))
+    failed = [result for result in results if result['error']]
+    stream.write('%d views from %d odbs, %d failed\n'%(
+        sum([len(result['views']) for result in results]),
+        len(results), len(failed)))
+    for result in failed:
+        stream.write('\n%s:\n%s\n'%(result['odb'], result['error'].rstrip()))
+
+
+def workerMain(args):   # {{{1
+    "Print the views for one odb; runs inside abaqus viewer noGUI"
+    resultName, viewFile, directory, odbName, name = args[:5]
+    result = {'odb': odbName, 'views': [], 'error': None}
+    start = time.time()
+    try:
+        from abaqus import session
+        import viewStore
+        import viewSave
+        odb = session.openOdb(name=odbName, readOnly=True)
+        session.viewports.values()[0].setValues(displayedObject=odb)
+        viewSave.store = viewStore.openStore(viewFile)
+        result['views'] = viewSave.printViews(name=name,
+                directory=directory, switchOdb=False)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.time() - start
+    f = open(resultName, 'w')
+    try:
+        json.dump(result, f)
+    finally:
+        f.close()
+
+
+def main(argv):  # {{{1
+    "Parse the command line, run the jobs and report; return exit status"
+    parser = OptionParser(usage='%prog [options] odb...')
+    parser.add_option('-v', '--views', dest='viewFile',
+            default=viewsCommon.xmlFileName,
+            help='userViews file, as opened by the plugin [%default]')
+    parser.add_option('-n', '--name', default='*',
+            help='shell-style pattern of view names to print [%default]')
+    parser.add_option('-o', '--output', default='.',
+            help='directory for the odb image directories [%default]')
+    parser.add_option('-j', '--processes', type='int', default=2,
+            help='number of simultaneous Abaqus sessions [%default]')
+    parser.add_option('--abaqus', default='abaqus',
+            help='command to start Abaqus [%default]')
+    parser.add_option('--report', help='also write the results as JSON')
+    parser.add_option('--stub', action='store_true',
+            help='use a stub worker instead of Abaqus')
+    options, odbNames = parser.parse_args(argv)
+    if not odbNames:
+        parser.error('no odbs given')
+
+    directories = jobDirectories(options.output, odbNames)
+    seen = {}
+    for odbName, directory in zip(odbNames, directories):
+        key = os.path.normcase(os.path.abspath(directory))
+        if seen.has_key(key):
+            parser.error('%s and %s would both print to %s'%(
+                seen[key], odbName, directory))
+        seen[key] = odbName
+
+    jobs = []
+    for odbName, directory in zip(odbNames, directories):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        jobs.append({'odb': os.path.abspath(odbName),
+            'viewFile': os.path.abspath(options.viewFile),
+            'directory': os.path.abspath(directory),
+            'name': options.name})
+
+    if options.stub:
+        worker = stubWorker
+    else:
+        worker = lambda job: abaqusWorker(job, options.abaqus)
+    results = runJobs(jobs, worker, max(1, options.processes))
+    report(results)
+    if options.report:
+        f = open(options.report, 'w')
+        try:
+            json.dump(results, f, indent=1)
+        finally:
+            f.close()
+    return len([result for result in results if result['error']]) and 1 or 0
+
+
+if '--worker' in sys.argv:
+    workerMain(sys.argv[sys.argv.index('--worker') + 1:])
+elif __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,316 @@
+"""Compact tree representation of saved userViews
+
+A userView element from the xml database is converted into nested tuples
+    (tag, attributes, text, children)
+which are much faster to walk than the xml dom and which serialize to a
+compact JSON array form. Text and child elements are kept separately; the
+interleaving of mixed content is not preserved since saveXml never
+produces it.
+
+Leaf text holds the repr() of a value; valueDecoder turns it back into the
+value without eval().
+
+Tag names dominate both the xml and the JSON text, so JSON alone is only
+slightly smaller; pack compresses it with zlib, which stores the repeated
+names once, for SQLite databases. The xml database and the views embedded
+in png files keep the xml form so older versions can read them.
+
+$Id$
+"""
+
+import re
+import zlib
+import json
+import hashlib
+
+TAG, ATTRIBUTES, TEXT, CHILDREN = range(4)
+
+# Option subtrees which are usually identical across many views; only
+# viewStore.sqliteStore stores them once
+blockTags = ('contourOptions', 'symbolOptions', 'superimposeOptions',
+        'commonOptions', 'viewportAnnotationOptions')
+blockKey = 'block'  # attribute of a reference node holding the block digest
+
+tokenRe = re.compile(r"""\s*(?:
+    (?P<string>[uU]?(?:'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"))
+  | (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?[lL]?)
+  | (?P<name>[-+]?[A-Za-z_]\w*)
+  | (?P<punct>[()\[\],])
+  )""", re.VERBOSE)
+
+
+def fromXml(xmlElement):    # {{{1
+    "Return the node tree equivalent to xmlElement"
+    attributes = {}
+    for key, value in xmlElement.attributes.items():
+        attributes[str(key)] = str(value)
+    text = []
+    children = []
+    for xmlChild in xmlElement.childNodes:
+        if xmlChild.ELEMENT_NODE == xmlChild.nodeType:
+            children.append(fromXml(xmlChild))
+        elif xmlChild.TEXT_NODE == xmlChild.nodeType or \
+                xmlChild.CDATA_SECTION_NODE == xmlChild.nodeType:
+            text.append(xmlChild.data)
+    return (str(xmlElement.tagName), attributes, ''.join(text), children)
+
+
+def toXml(node, document):  # {{{1
+    "Return a new xml element of document equivalent to node"
+    tag, attributes, text, children = node
+    xmlElement = document.createElement(tag)
+    for key, value in attributes.items():
+        xmlElement.setAttribute(key, value)
+    if text:
+        xmlElement.appendChild(document.createTextNode(text))
+    for child in children:
+        xmlElement.appendChild(toXml(child, document))
+    return xmlElement
+
+
+def findAll(node, tag):     # {{{1
+    "Return list of all descendants of node with the given tag"
+    found = []
+    for child in node[CHILDREN]:
+        if tag == child[TAG]:
+            found.append(child)
+        found.extend(findAll(child, tag))
+    return found
+
+
+def toArray(node):  # {{{1
+    "Return node as nested lists with empty trailing items removed"
+    tag, attributes, text, children = node
+    array = [tag, text, [toArray(child) for child in children], attributes]
+    while len(array) > 1 and not array[-1]:
+        array.pop()
+    return array
+
+
+def fromArray(array):   # {{{1
+    "Return the node described by nested lists from toArray"
+    array = list(array) + ['', [], {}][len(array) - 1:]
+    tag, text, children, attributes = array
+    return (str(tag), dict([(str(key), str(value))
+                for key, value in attributes.items()]),
+            text, [fromArray(child) for child in children])
+
+
+class valueDecoder:  # {{{1
+    """Decode the repr() text of numbers, strings, tuples, lists and names
+
+    Names are looked up in the constants dictionary, for example the
+    abaqusConstants symbolic constants. Each distinct text is decoded once.
+    """
+
+    floatNames = ('inf', 'nan')    # repr() of special float values
+
+    def __init__(self, constants):
+        self.constants = constants
+        self.cache = {}
+
+    def decode(self, text):
+        "Return the value described by text; raise ValueError if invalid"
+        try:
+            value = self.cache[text]
+        except KeyError:
+            value = self.cache[text] = self.parse(text)
+        if isinstance(value, list):
+            return list(value)  # cached lists must not be shared
+        return value
+
+    def tokens(self, text):
+        "Return list of (kind, token) pairs"
+        tokens = []
+        pos = 0
+        end = len(text.rstrip())
+        while pos < end:
+            m = tokenRe.match(text, pos)
+            if not m:
+                raise ValueError('Cannot decode %r'%text)
+            tokens.append( (m.lastgroup, m.group(m.lastgroup)) )
+            pos = m.end()
+        return tokens
+
+    def parse(self, text):
+        "Return the value described by text without using the cache"
+        tokens = self.tokens(text)
+        if not tokens:
+            raise ValueError('Cannot decode empty text')
+        try:
+            value, pos = self.parseValue(tokens, 0)
+        except IndexError:
+            raise ValueError('Incomplete %r'%text)
+        if pos != len(tokens):
+            raise ValueError('Cannot decode %r'%text)
+        return value
+
+    def parseValue(self, tokens, pos):
+        "Return value starting at tokens[pos] and the position after it"
+        kind, token = tokens[pos]
+        if 'number' == kind:
+            digits = token.rstrip('lL')
+            if '.' in digits or 'e' in digits or 'E' in digits:
+                return float(digits), pos + 1
+            return int(digits), pos + 1
+        if 'string' == kind:
+            if token[0] in 'uU':
+                return token[2:-1].decode('unicode_escape'), pos + 1
+            return token[1:-1].decode('string_escape'), pos + 1
+        if 'name' == kind:
+            if token.lstrip('-+') in self.floatNames:
+                return float(token), pos + 1
+            if not self.constants.has_key(token):
+                raise ValueError('Unknown name %r'%token)
+            return self.constants[token], pos + 1
+        if token in ('(', '['):
+            close = {'(': ')', '[': ']'}[token]
+            items = []
+            comma = False
+            pos += 1
+            while tokens[pos][1] != close:
+                value, pos = self.parseValue(tokens, pos)
+                items.append(value)
+                if tokens[pos][1] == ',':
+                    comma = True
+                    pos += 1
+                elif tokens[pos][1] != close:
+                    raise ValueError('Expected %r'%close)
+            if '[' == token:
+                return items, pos + 1
+            if 1 == len(items) and not comma:
+                return items[0], pos + 1    # parentheses around one value
+            return tuple(items), pos + 1
+        raise ValueError('Unexpected %r'%token)
+
+
+def blockDigest(node):  # {{{1
+    "Return hex digest identifying the content of node"
+    return hashlib.sha1(json.dumps(toArray(node), separators=(',', ':'),
+        sort_keys=True)).hexdigest()
+
+
+def splitBlocks(node, blocks):  # {{{1
+    """Return node with option blocks replaced by reference nodes
+
+    Each block is added to the blocks dictionary by its digest.
+    """
+    tag, attributes, text, children = node
+    if tag in blockTags:
+        digest = blockDigest(node)
+        blocks[digest] = node
+        return (tag, {blockKey: digest}, '', [])
+    return (tag, attributes, text,
+            [splitBlocks(child, blocks) for child in children])
+
+
+def joinBlocks(node, getBlock):  # {{{1
+    """Return node with reference nodes replaced by getBlock(digest)
+
+    References for which getBlock returns None are left in place. The
+    blocks may be shared by several nodes so they must not be modified.
+    """
+    tag, attributes, text, children = node
+    if tag in blockTags and attributes.has_key(blockKey):
+        return getBlock(attributes[blockKey]) or node
+    return (tag, attributes, text,
+            [joinBlocks(child, getBlock) for child in children])
+
+
+def dumps(node):    # {{{1
+    "Return compact JSON text describing node"
+    return json.dumps(toArray(node), separators=(',', ':'))
+
+
+def loads(text):    # {{{1
+    "Return the node described by JSON text from dumps"
+    return fromArray(json.loads(text))
+
+
+def pack(node):     # {{{1
+    "Return zlib compressed JSON bytes describing node"
+    return zlib.compress(dumps(node), 9)
+
+
+def unpack(data):   # {{{1
+    "Return the node described by pack or dumps data"
+    if data.startswith('['):
+        return loads(data)  # stored uncompressed by earlier versions
+    return loads(zlib.decompress(data))
+
+
+if __name__ == '__main__':  # {{{1 Compare size and speed with the xml dom
+    import time
+    from xml.dom import minidom
+
+    def leaves(document, parent, values):
+        for tag, value in values:
+            leaf = document.createElement(tag)
+            leaf.appendChild(document.createTextNode(value))
+            parent.appendChild(leaf)
+
+    def options(document, parent, tag, count):
+        element = document.createElement(tag)
+        parent.appendChild(element)
+        leaves(document, element, [('member%d'%i,
+            ['ON', 'OFF', '0.5', "'Helvetica'", '(0.0, 0.0, 1.0)'][i%5])
+            for i in range(count)])
+
+    # Viewport tree similar to what saveXml stores with contours on
+    document = minidom.Document()
+    viewport = document.createElement('Viewport')
+    viewport.setAttribute('name', 'Viewport: 1')
+    document.appendChild(viewport)
+    leaves(document, viewport, [('origin', '(0.0, 0.0)'),
+        ('width', '281.25'), ('height', '180.0')])
+    options(document, viewport, 'viewportAnnotationOptions', 45)
+    options(document, viewport, 'view', 7)
+    odbDisplay = document.createElement('odbDisplay')
+    odbDisplay.setAttribute('name', '/scratch/bracket/Job-1.odb')
+    viewport.appendChild(odbDisplay)
+    options(document, odbDisplay, 'display', 1)
+    for tag, count in [('contourOptions', 70), ('symbolOptions', 45),
+            ('superimposeOptions', 35), ('commonOptions', 45),
+            ('viewCutOptions', 25)]:
+        options(document, odbDisplay, tag, count)
+
+    repeat = 200
+    xmlText = viewport.toxml('utf-8')
+    node = fromXml(viewport)
+    jsonText = dumps(node)
+    packed = pack(node)
+    assert loads(jsonText) == node
+    assert unpack(packed) == node and unpack(jsonText) == node
+    assert fromXml(toXml(node, minidom.Document())) == node
+    print "size: xml %d bytes, json %d bytes (%.1fx smaller), " \
+            "packed %d bytes (%.1fx smaller)"%(len(xmlText), len(jsonText),
+            float(len(xmlText))/len(jsonText), len(packed),
+            float(len(xmlText))/len(packed))
+
+    def timeit(function, *args):
+        start = time.time()
+        for i in range(repeat):
+            function(*args)
+        return (time.time() - start)/repeat
+
+    def walkXml(xmlElement):
+        "Visit the dom like viewSave.restoreXml did"
+        for xmlChild in xmlElement.childNodes:
+            if xmlChild.ELEMENT_NODE == xmlChild.nodeType and \
+                    not len(xmlChild.getAttribute('type')):
+                walkXml(xmlChild)
+
+    def walkNode(node):
+        for child in node[CHILDREN]:
+            if not child[ATTRIBUTES].get('type'):
+                walkNode(child)
+
+    for label, xmlTime, nodeTime in [
+            ('serialize', timeit(viewport.toxml, 'utf-8'), timeit(dumps, node)),
+            ('parse', timeit(minidom.parseString, xmlText),
+                timeit(loads, jsonText)),
+            ('unpack', timeit(minidom.parseString, xmlText),
+                timeit(unpack, packed)),
+            ('walk', timeit(walkXml, viewport), timeit(walkNode, node))]:
+        print "%-9s xml %7.3f ms, json %7.3f ms (%.1fx faster)"%(
+                label, 1e3*xmlTime, 1e3*nodeTime, xmlTime/nodeTime)
@@ -1,38 +1,226 @@
 #!/usr/bin/env python
 """Embed userView data into png file.
 
-Usage: viewEmbed.py userViews.xml
+Usage: viewEmbed.py [options] userViews.xml [more.xml...]
+
+Each view is written as a tEXt userView chunk of the png named after the
+view. Only chunk headers are read; a png whose embedded view has the same
+checksum is left alone, and when the old view is the last chunk before
+IEND only the tail of the file is rewritten.
 $Id$
 """
 import sys, os
+import struct
+import zlib
+from optparse import OptionParser
+from multiprocessing.pool import ThreadPool
+
+pngSignature = '\x89PNG\r\n\x1a\n'
+textKey = 'userView'
+iendChunk = struct.pack('>I', 0) + 'IEND' + \
+        struct.pack('>I', zlib.crc32('IEND') & 0xffffffff)
+bufferSize = 1 << 16
+
+
+def encodeChunk(chunkType, data):
+    "Return the png chunk bytes with length and crc"
+    return struct.pack('>I', len(data)) + chunkType + data + \
+            struct.pack('>I', zlib.crc32(chunkType + data) & 0xffffffff)
+
+
+def scanChunks(f):
+    """Return list of (offset, size, type, crc, isView) of the png chunks
+
+    Chunk data is skipped except for the key of tEXt chunks.
+    """
+    if f.read(len(pngSignature)) != pngSignature:
+        raise ValueError('%s is not a png file'%f.name)
+    chunks = []
+    while True:
+        offset = f.tell()
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError('%s has no IEND chunk'%f.name)
+        length, chunkType = struct.unpack('>I4s', header)
+        isView = False
+        if 'tEXt' == chunkType:
+            isView = f.read(len(textKey) + 1) == textKey + '\0'
+        f.seek(offset + 8 + length)
+        crc = f.read(4)
+        chunks.append( (offset, length + 12, chunkType, crc, isView) )
+        if 'IEND' == chunkType:
+            return chunks
+
+
+def copyRange(source, destination, offset, size):
+    "Copy size bytes at offset of source using a bounded buffer"
+    source.seek(offset)
+    while size > 0:
+        data = source.read(min(size, bufferSize))
+        if not data:
+            raise ValueError('%s is truncated'%source.name)
+        destination.write(data)
+        size -= len(data)
+
+
+def embed(fileName, xmlText, atomic=False):
+    """Store xmlText in fileName; return False if it was already there
+
+    Unless atomic is set, a view at the end of the file is replaced in
+    place. Otherwise a copy is written and renamed over the original.
+    """
+    newChunk = encodeChunk('tEXt', textKey + '\0' + xmlText)
+    f = open(fileName, 'rb')
+    try:
+        chunks = scanChunks(f)
+        viewChunks = [i for i, chunk in enumerate(chunks) if chunk[4]]
+        if 1 == len(viewChunks):
+            offset, size, chunkType, crc, isView = chunks[viewChunks[0]]
+            if size == len(newChunk) and crc == newChunk[-4:]:
+                return False    # same checksum; nothing to do
+        iend = len(chunks) - 1
+        tail = viewChunks == range(iend - len(viewChunks), iend)
+        stat = os.fstat(f.fileno())
+        if atomic or not tail:
+            tempName = fileName + '.tmp'
+            outfile = open(tempName, 'wb')
+            try:
+                outfile.write(pngSignature)
+                for i, (offset, size, chunkType, crc, isView) in \
+                        enumerate(chunks):
+                    if isView:
+                        continue    # discard old view data
+                    if i == iend:
+                        # Insert view just before end
+                        outfile.write(newChunk)
+                    copyRange(f, outfile, offset, size)
+            finally:
+                outfile.close()
+    finally:
+        f.close()
+
+    if atomic or not tail:
+        os.utime(tempName, (stat.st_atime, stat.st_mtime))
+        if os.name == 'nt' and os.path.exists(fileName):
+            os.remove(fileName)     # rename cannot replace on Windows
+        os.rename(tempName, fileName)
+    else:
+        # Only the old view (if any) and IEND follow the pixel data
+        offset = chunks[(viewChunks or [iend])[0]][0]
+        outfile = open(fileName, 'r+b')
+        try:
+            outfile.seek(offset)
+            outfile.write(newChunk)
+            outfile.write(iendChunk)
+            outfile.truncate()
+        finally:
+            outfile.close()
+        os.utime(fileName, (stat.st_atime, stat.st_mtime))
+    return True
+
+
+def storeViews(store):
+    "Yield (name, view id) of each view in database order"
+    for header in store.headers.values():
+        name = header.name
+        if isinstance(name, unicode):
+            name = name.encode(sys.getfilesystemencoding() or 'utf-8')
+        yield name, header.id
+
+
+def imageKey(name):
+    "Return the index key of a png path relative to a search directory"
+    return os.path.normcase(os.path.normpath(name))
+
+
+def imageIndex(directories):
+    """Return dictionary of image key: list of png paths in directories
+
+    Each png is keyed by its path relative to the search directory it was
+    found in, so a view is only embedded in the image printToFile would
+    have written with that directory as the working directory.
+    """
+    index = {}
+    for directory in directories:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() == '.png':
+                    path = os.path.join(dirpath, filename)
+                    index.setdefault(imageKey(os.path.relpath(path,
+                        directory)), []).append(path)
+    return index
+
+
+def imagePaths(name, index=None):
+    """Return the png files of the view name
+
+    Without an index the image is name + '.png' in the working directory.
+    """
+    fileName = name + '.png'
+    if index is None:
+        if os.path.isfile(fileName):
+            return [fileName]
+        return []
+    return index.get(imageKey(fileName), [])
+
+
+def embedTask(task):
+    "Embed one view; return (path, 'changed', 'skipped' or 'failed', message)"
+    path, text, atomic = task
+    try:
+        if embed(path, text, atomic):
+            return path, 'changed', ''
+        return path, 'skipped', ''
+    except (ValueError, IOError, OSError):
+        return path, 'failed', str(sys.exc_info()[1])
+
+
+def main(argv):
+    "Embed the views of each database in the matching png files"
+    parser = OptionParser(usage='%prog [options] userViews.xml...')
+    parser.add_option('-d', '--directory', action='append', default=[],
+            help='match view names to png paths relative to this '
+            'directory and its subdirectories (repeatable); by default '
+            'name.png in the current directory is used')
+    parser.add_option('-j', '--threads', type='int', default=1,
+            help='number of files processed at once [%default]')
+    options, databases = parser.parse_args(argv)
+    if not databases:
+        parser.error('no userViews database given')
+
+    import viewStore
+
+    index = None
+    if options.directory:
+        index = imageIndex(options.directory)
+    atomic = bool(options.directory) or options.threads > 1
+    texts = {}  # path: xml text, later databases replace earlier views
+    for database in databases:
+        store = viewStore.openStore(database)
+        for name, viewId in storeViews(store):
+            paths = imagePaths(name, index)
+            if paths:
+                text = store.getView(viewId).toxml('utf-8')
+                for path in paths:
+                    texts[path] = text
+    tasks = [(path, texts[path], atomic) for path in sorted(texts)]
+
+    counts = dict.fromkeys(['changed', 'skipped', 'failed'], 0)
+    pool = ThreadPool(max(1, options.threads))
+    try:
+        for path, status, message in pool.imap_unordered(embedTask, tasks):
+            counts[status] += 1
+            if 'changed' == status:
+                print path
+            elif 'failed' == status:
+                print path, message
+    finally:
+        pool.close()
+        pool.join()
+    print "%(changed)d png files changed, %(skipped)d already up to date, " \
+            "%(failed)d failed"%counts
+    return counts['failed'] and 1 or 0
+
 
-if len(sys.argv) != 2:
-    sys.exit(__doc__)
-
-from xml.dom import minidom
-import pngFile
-
-xmldoc = minidom.parse(sys.argv[1])
-for view in xmldoc.getElementsByTagName("userView"):
-    fname = view.getAttribute('name') + '.png'
-    if os.path.exists(fname):
-        stat = os.stat(fname)
-        outfile = open(fname + '2', 'wb') # temporary file
-        # outfile = tempfile.NamedTemporaryFile()
-        outfile.write(pngFile.pngSignature)
-        for chunk in pngFile.readChunks(open(fname, 'rb')):
-            if chunk.startswith('tEXt'):
-                key, value = chunk[4:].split('\0', 1)
-                if key == 'userView':
-                    continue # discard old view data
-            elif chunk.startswith('IEND'):
-                # Insert view just before end
-                outfile.write(pngFile.encodeChunk('tEXtuserView\0' +
-                    str(view.toxml())))
-            # copy chunk to outfile
-            outfile.write(pngFile.encodeChunk(chunk))
-        print fname
-        outfile.close()
-        os.utime(outfile.name, (stat.st_atime, stat.st_mtime))
-        os.remove(fname)
-        os.rename(outfile.name, fname)
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
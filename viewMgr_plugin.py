@@ -7,7 +7,12 @@ $Id$
 from abaqusGui import *
 import abaqusConstants
 import viewsCommon
-import re
+import thumbCache
+
+def rowKey(row):
+    "Return (view id, odb name) identifying a customData.userViews row"
+    return row[0], row[3]
+
 
 class myQuery:
     "Object used to register/unregister Queries"
@@ -27,6 +32,7 @@ class myAFXTable(AFXTable):
         if notify:
             ids = [ self.getItemValue(row, 0) 
                     for row in range(startRow, startRow + numRows) ]
+            del self.shown[startRow - 1:startRow - 1 + numRows]
             AFXTable.deleteRows(self, startRow, numRows, notify)
             sendCommand("viewSave.deleteViews(%r)"%ids)
         else:
@@ -49,8 +55,17 @@ class viewManagerDB(AFXDataDialog):
         ID_DELVIEW,
         ID_BUTTON_ANNOTATION,
         ID_BUTTON_FILE,
+        ID_FILTER_TIMEOUT,
+        ID_PREFETCH_TIMEOUT,
+        ID_ICON_TIMEOUT,
         ID_LAST
-    ) = range(AFXDataDialog.ID_LAST, AFXDataDialog.ID_LAST + 7)
+    ) = range(AFXDataDialog.ID_LAST, AFXDataDialog.ID_LAST + 10)
+
+    filterDelay = 300   # milliseconds to wait for more typing
+    prefetchDelay = 200 # milliseconds the selection must stay before decoding
+    prefetchRows = (1, -1, 2)   # table neighbours decoded with the selection
+    iconDelay = 500     # milliseconds between checks for thumbnails of rows
+    iconColumn = 1      # the name column shows the thumbnail
 
 
     def __init__(self, form):
@@ -72,8 +87,13 @@ class viewManagerDB(AFXDataDialog):
                 sel=self.ID_TABLE,
                 opts=AFXTABLE_NORMAL|AFXTABLE_ROW_MODE)
 #                    AFXTABLE_BROWSE_SELECT|AFXTABLE_ROW_MODE)
+        self.table.shown = []   # rows in the table after the leading row
         FXMAPFUNC(self, SEL_CLICKED, self.ID_TABLE, viewManagerDB.onTable)
         FXMAPFUNC(self, SEL_COMMAND, self.ID_TABLE, viewManagerDB.onCommand)
+        FXMAPFUNC(self, SEL_TIMEOUT, self.ID_PREFETCH_TIMEOUT,
+                viewManagerDB.onPrefetchTimeout)
+        FXMAPFUNC(self, SEL_TIMEOUT, self.ID_ICON_TIMEOUT,
+                viewManagerDB.onIconTimeout)
         self.table.setLeadingRows(numRows=1)
         self.table.setLeadingRowLabels('Id\tName\tDate\tOdbName\tA')
         self.table.setColumnWidth(0, 0) # Don't show id column
@@ -89,14 +109,27 @@ class viewManagerDB(AFXDataDialog):
                 AFXTable.POPUP_DELETE_ROW
                 |AFXTable.POPUP_FILE)
 
+        self.preview = FXLabel(p=mainframe, text='No thumbnail',
+                opts=LAYOUT_CENTER_X)
+        self.previewIcon = None
+        self.thumbnails = None  # thumbCache of customData.userViewsFile
+        self.icons = {}     # FXPNGIcon for the table by view id
+        self.requested = set()  # view ids the kernel was asked to make
+
         self.filter = ''  # Don't filter anything
+        self.model = []     # all rows in sorted order
+        self.matches = set()    # view ids found by viewSave.searchViews
+        self.selectedRow = None
         AFXTextField(p=mainframe,
                 ncols=15,
-                labelText='Regular expression filter:',
+                labelText='Search (name:, odb:, var:, cut:, text:, date:) '
+                    'or regular expression:',
                 tgt=self,
                 sel=self.ID_FILTER,
                 opts=LAYOUT_FILL_X)
         FXMAPFUNC(self, SEL_COMMAND, self.ID_FILTER, viewManagerDB.onFilter)
+        FXMAPFUNC(self, SEL_TIMEOUT, self.ID_FILTER_TIMEOUT,
+                viewManagerDB.onFilterTimeout)
 
         self.appendActionButton(text="File...", tgt=self, sel=self.ID_BUTTON_FILE)
         FXMAPFUNC(self, SEL_COMMAND, self.ID_BUTTON_FILE, viewManagerDB.onButtonFile)
@@ -114,55 +147,185 @@ class viewManagerDB(AFXDataDialog):
                 sel=form.ID_FNTARGET,
                 #mode=AFXSELECTFILE_EXISTING,
                 readOnlyKw=None,
-                patterns="*.xml\nAll Files (*)")
+                patterns="*.xml\nSQLite database (*.db,*.sqlite)\nAll Files (*)")
         
 
     def updateTable(self):
         "Read view settings from customData.userViews registered list"
-        sortColumn = self.table.getCurrentSortColumn()
+        self.sortModel()
+        self.updateFilter()
 
-        # Collect filtered table data
-        filtered = []
-        filterre = re.compile(self.filter, re.IGNORECASE)
-        for row in session.customData.userViews:
-            if filterre.search(' '.join(row)):
-                filtered.append( (row[sortColumn].lower(), row) )
 
-        # Sort table data
-        filtered.sort()
+    def sortModel(self):
+        "Sort all rows by the current sort column"
+        sortColumn = self.table.getCurrentSortColumn()
+        model = [ (row[sortColumn].lower(), row)
+                for row in session.customData.userViews ]
+        model.sort()
         if self.table.getColumnSortOrder(sortColumn) == AFXTable.SORT_DESCENDING:
-            filtered.reverse()
-
-        # Adjust table widget size
-        diff = len(filtered) + 1 - self.table.getNumRows()
-        if diff > 0:
-            self.table.insertRows(
-                    startRow=1,
-                    numRows=diff,
-                    notify=FALSE)
-        elif diff < 0:
-            self.table.deleteRows(
-                    startRow=1,
-                    numRows=-diff,
-                    notify=FALSE)
-
-        # Update table widget
+            model.reverse()
+        self.model = [row for key, row in model]
+
+
+    def updateMatches(self):
+        "Read search results from customData.userViewMatches registered list"
+        self.matches = set(session.customData.userViewMatches)
+        self.updateFilter()
+
+
+    def updateFilter(self):
+        "Show the sorted model rows which match the search"
+        if self.filter.strip():
+            self.showRows([row for row in self.model
+                if row[0] in self.matches])
+        else:
+            self.showRows(self.model)
+
+
+    def showRows(self, rows):
+        """Change only the table rows which differ from rows
+
+        Rows are matched by (view id, odb name) in a single pass, so
+        narrowing or widening the search only deletes or inserts rows.
+        """
+        shown = self.table.shown
+        wanted = set([rowKey(row) for row in rows])
+        # Delete runs of rows which are no longer wanted, from the bottom
+        end = len(shown)
+        for i in range(len(shown) - 1, -2, -1):
+            if i >= 0 and not rowKey(shown[i]) in wanted:
+                continue
+            if end > i + 1:
+                self.table.deleteRows(startRow=2 + i, numRows=end - i - 1,
+                        notify=FALSE)
+            end = i
+        kept = [row for row in shown if rowKey(row) in wanted]
+        keptKeys = set([rowKey(row) for row in kept])
+
+        # Walk both lists inserting runs of new rows
+        i = j = 0
+        while j < len(rows):
+            if i < len(kept) and rowKey(kept[i]) == rowKey(rows[j]):
+                if kept[i] != rows[j]:
+                    self.setRow(1 + j, rows[j])     # e.g. renamed
+                i += 1
+                j += 1
+            elif not rowKey(rows[j]) in keptKeys:
+                start = j
+                while j < len(rows) and not rowKey(rows[j]) in keptKeys:
+                    j += 1
+                self.table.insertRows(startRow=1 + start,
+                        numRows=j - start, notify=FALSE)
+                for k in range(start, j):
+                    self.setRow(1 + k, rows[k])
+            else:
+                # The order changed, e.g. by sorting; overwrite the rest
+                old = kept[i:]
+                new = rows[j:]
+                if len(new) > len(old):
+                    self.table.insertRows(startRow=1 + j + len(old),
+                            numRows=len(new) - len(old), notify=FALSE)
+                elif len(old) > len(new):
+                    self.table.deleteRows(startRow=1 + j + len(new),
+                            numRows=len(old) - len(new), notify=FALSE)
+                for k, row in enumerate(new):
+                    if k >= len(old) or old[k] != row:
+                        self.setRow(1 + j + k, row)
+                break
+        self.table.shown = list(rows)
+        self.showIcons()
+
+        # Update selection
         selected = self.getMode().viewId.getValue()
-        for row, (key, rowtext) in enumerate(filtered):
-            tableRow = row + 1
+        if self.selectedRow and self.selectedRow < self.table.getNumRows():
+            self.table.deselectRow(self.selectedRow)
+        self.selectedRow = None
+        for row, rowtext in enumerate(rows):
             if rowtext[0] == selected:
-                selected = tableRow
-            self.table.deselectRow(tableRow)
-            for col, itemtext in enumerate(rowtext):
-                # TODO make icon for annotation column
-                self.table.setItemValue(
-                        row=tableRow,
-                        column=col,
-                        valueText=itemtext)
-
-        if isinstance(selected, int):
-            self.table.selectRow(selected)
-            self.table.makeRowVisible(selected)
+                self.selectedRow = row + 1
+                self.table.selectRow(self.selectedRow)
+                self.table.makeRowVisible(self.selectedRow)
+                break
+
+
+    def setRow(self, tableRow, rowtext):
+        "Write rowtext into the table widget"
+        self.table.deselectRow(tableRow)
+        for col, itemtext in enumerate(rowtext):
+            # TODO make icon for annotation column
+            self.table.setItemValue(
+                    row=tableRow,
+                    column=col,
+                    valueText=itemtext)
+        # Icons move with inserted and deleted rows; replace the old one
+        self.table.setItemIcon(tableRow, self.iconColumn,
+                self.icons.get(rowtext[0]))
+
+
+    def thumbnailCache(self):
+        "Return thumbCache of the current userViews database or None"
+        if not len(session.customData.userViewsFile):
+            return None
+        database = session.customData.userViewsFile[0]
+        if not self.thumbnails or self.thumbnails.database != database:
+            self.thumbnails = thumbCache.thumbCache(
+                    viewsCommon.thumbnailDirectory, database,
+                    viewsCommon.thumbnailMemory)
+            self.icons = {}
+            self.requested = set()
+        return self.thumbnails
+
+
+    def showIcons(self):
+        """Show thumbnails in the visible table rows which have none
+
+        Thumbnails which are not in the cache are made by the kernel,
+        only for the views in these rows.
+        """
+        thumbnails = self.thumbnailCache()
+        if not thumbnails:
+            return
+        top = max(1, self.table.getTopRow())
+        bottom = min(self.table.getNumRows(),
+                top + self.table.getNumVisibleRows() + 1)
+        missing = []
+        for tableRow in range(top, bottom):
+            viewId = self.table.shown[tableRow - 1][0]
+            if self.icons.has_key(viewId):
+                continue
+            data = thumbnails.get(viewId)
+            if data:
+                icon = FXPNGIcon(getAFXApp(), data)
+                width, height = viewsCommon.thumbnailIconSize
+                scale = max(float(icon.getWidth())/width,
+                        float(icon.getHeight())/height, 1.0)
+                icon.scale(max(1, int(icon.getWidth()/scale)),
+                        max(1, int(icon.getHeight()/scale)))
+                icon.create()
+                self.icons[viewId] = icon
+                self.table.setItemIcon(tableRow, self.iconColumn, icon)
+            elif not viewId in self.requested:
+                missing.append(viewId)
+        if missing:
+            self.requested.update(missing)
+            sendCommand("viewSave.makeThumbnails(%r)"%missing)
+
+
+    def showThumbnail(self, viewId):
+        "Load the full size thumbnail of the selected view into the preview"
+        data = None
+        thumbnails = self.thumbnailCache()
+        if thumbnails:
+            data = thumbnails.get(viewId)
+        if data:
+            self.previewIcon = FXPNGIcon(getAFXApp(), data)
+            self.previewIcon.create()
+            self.preview.setIcon(self.previewIcon)
+            self.preview.setText('')
+        else:
+            self.preview.setIcon(None)
+            self.preview.setText('No thumbnail')
+            self.previewIcon = None
 
 
     def onCommand(self, sender, sel, ptr):
@@ -181,15 +344,46 @@ class viewManagerDB(AFXDataDialog):
         if row > 0:
             id = sender.getItemValue(row, 0)
             self.getMode().viewId.setValue(id)
+            self.showThumbnail(id)
+            app = getAFXApp()
+            app.removeTimeout(self, self.ID_PREFETCH_TIMEOUT)
+            app.addTimeout(self, self.ID_PREFETCH_TIMEOUT, self.prefetchDelay)
         if row == 0:
             self.updateTable()  # sorting has changed
         return 0
  
 
+    def onPrefetchTimeout(self, sender, sel, ptr):
+        "Selection has settled; decode it and its neighbours in the kernel"
+        selected = self.getMode().viewId.getValue()
+        ids = [row[0] for row in self.table.shown]
+        if selected in ids:
+            index = ids.index(selected)
+            neighbours = [ids[index + offset] for offset in self.prefetchRows
+                    if 0 <= index + offset < len(ids)]
+            sendCommand("viewSave.prefetchViews(%r, %r)"%(selected, neighbours))
+        return 0
+
+
     def onFilter(self, sender, sel, ptr):
-        "Search field was changed"
+        "Search field was changed; wait for the user to stop typing"
         self.filter = sender.getText()
-        self.updateTable()
+        app = getAFXApp()
+        app.removeTimeout(self, self.ID_FILTER_TIMEOUT)
+        app.addTimeout(self, self.ID_FILTER_TIMEOUT, self.filterDelay)
+        return 0
+
+
+    def onFilterTimeout(self, sender, sel, ptr):
+        "Search once typing has paused; the kernel updates userViewMatches"
+        sendCommand("viewSave.searchViews(%r)"%self.filter)
+        return 0
+
+
+    def onIconTimeout(self, sender, sel, ptr):
+        "Show thumbnails of rows scrolled into view or made by the kernel"
+        self.showIcons()
+        getAFXApp().addTimeout(self, self.ID_ICON_TIMEOUT, self.iconDelay)
         return 0
 
 
@@ -212,13 +406,18 @@ class viewManagerDB(AFXDataDialog):
         # Register query and populate the table
         self.userViewsQuery = \
                 myQuery(session.customData.userViews, self.updateTable)
+        self.matchesQuery = \
+                myQuery(session.customData.userViewMatches, self.updateMatches)
         self.updateTable()
+        getAFXApp().addTimeout(self, self.ID_ICON_TIMEOUT, self.iconDelay)
         return AFXDataDialog.show(self)
 
 
     def hide(self):
         "Called to remove the dialog box"
         del self.userViewsQuery
+        del self.matchesQuery
+        getAFXApp().removeTimeout(self, self.ID_ICON_TIMEOUT)
         sendCommand("viewSave.writeXmlFile()")
         return AFXDataDialog.hide(self)
 
@@ -0,0 +1,343 @@
+"""Decoded restore plans of saved userViews
+
+A plan holds everything viewSave needs from a viewCodec node to restore
+it, with the leaf text already decoded:
+    (tag, arguments, setValues, children)
+arguments are the keywords used if the matching Abaqus attribute is a
+method, setValues is a tuple of (member, value) pairs and children are
+the plans of child elements which have children, attributes or no text
+of their own, such as <maximize/> which calls a method without
+arguments; other leaves only supply values.
+
+Building a plan does not use abaqus so it may be done on any thread, and
+planCache keeps recently used plans so restoring a view again skips the
+database read, the tree walk and the value decoding. prefetchThread
+builds the plans of the views predicted by predictViews while the user is
+idle so that restoring them only has to apply the values.
+
+$Id$
+"""
+
+import sys
+import threading
+import viewCodec
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict  # Python < 2.7 evicts in arbitrary order
+
+TAG, ARGUMENTS, SETVALUES, CHILDREN = range(4)
+
+
+def buildPlan(node, decoder, errors=None):   # {{{1
+    """Return the restore plan of node; undecodable values are skipped
+
+    Decoding errors are printed unless an errors list is given to collect
+    them.
+    """
+    if errors is None:
+        errors = printErrors()
+    tag, attributes, text, children = node
+    arguments = dict(attributes)
+    setValues = []
+    plans = []
+    for child in children:
+        childTag, childAttributes, childText, grandChildren = child
+        childType = childAttributes.get('type')
+        if 'argument' == childType:
+            try:
+                arguments[childTag] = decoder.decode(childText.strip())
+            except ValueError:
+                errors.append( (childTag, sys.exc_info()[1]) )
+        elif not childType:
+            value = childText.strip()
+            if grandChildren or childAttributes or not len(value):
+                # members or a method call, possibly without arguments
+                plans.append(buildPlan(child, decoder, errors))
+            if len(value):
+                try:
+                    setValues.append( (childTag, decoder.decode(value)) )
+                except ValueError:
+                    errors.append( (childTag, sys.exc_info()[1]) )
+    return (tag, arguments, tuple(setValues), tuple(plans))
+
+
+class printErrors:  # {{{1
+    "Print decoding errors as they are appended"
+
+    def append(self, error):
+        print error[0], error[1]
+
+
+def viewSortKey(view):  # {{{1
+    "Return (odb names, primary variables) used to group similar views"
+    odbNames = tuple([node[viewCodec.ATTRIBUTES].get('name', '')
+        for node in viewCodec.findAll(view, 'odbDisplay')])
+    variables = tuple([leaf[viewCodec.TEXT]
+        for command in viewCodec.findAll(view, 'setPrimaryVariable')
+        for leaf in command[viewCodec.CHILDREN]
+        if 'variableLabel' == leaf[viewCodec.TAG]])
+    return odbNames, variables
+
+
+def planView(view, decoder, errors=None):    # {{{1
+    """Return (name, dateTime, sort key, viewport plans) of a userView node
+
+    viewport plans is a tuple of (viewport name, plan) in database order.
+    """
+    attributes = view[viewCodec.ATTRIBUTES]
+    vpPlans = tuple([(vpNode[viewCodec.ATTRIBUTES].get('name', ''),
+            buildPlan(vpNode, decoder, errors))
+        for vpNode in viewCodec.findAll(view, 'Viewport')])
+    return (attributes.get('name'), attributes.get('dateTime'),
+            viewSortKey(view), vpPlans)
+
+
+class planCache:    # {{{1
+    """Least recently used view plans bounded by count and estimated bytes
+
+    The size given with each plan is an estimate of its memory use, such
+    as the length of the view in viewCodec JSON form.
+    """
+
+    def __init__(self, maxEntries=50, maxBytes=1 << 24):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()    # view id: (plan, size), oldest first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0     # changed whenever plans become invalid
+        self.lock = threading.Lock()    # plans may be added by a thread
+
+    def get(self, viewId):
+        "Return the plan of viewId or None, counting the hit or miss"
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(viewId, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries[viewId] = entry    # most recently used
+            return entry[0]
+        finally:
+            self.lock.release()
+
+    def has(self, viewId):
+        "Return True if viewId is cached, without changing its age or counters"
+        return self.entries.has_key(viewId)
+
+    def put(self, viewId, plan, size, generation=None):
+        """Add plan of viewId, evicting the least recently used as needed
+
+        If generation is given the plan is only added, and True returned,
+        if nothing has been invalidated since the generation was read.
+        """
+        self.lock.acquire()
+        try:
+            if generation is not None and generation != self.generation:
+                return False
+            old = self.entries.pop(viewId, None)
+            if old:
+                self.size -= old[1]
+            self.entries[viewId] = (plan, size)
+            self.size += size
+            while len(self.entries) > 1 and (len(self.entries) >
+                    self.maxEntries or self.size > self.maxBytes):
+                if OrderedDict is dict:
+                    oldId, old = self.entries.popitem()
+                else:
+                    oldId, old = self.entries.popitem(last=False)
+                self.size -= old[1]
+        finally:
+            self.lock.release()
+        return True
+
+    def discard(self, viewId):
+        "Forget viewId after it is renamed or deleted"
+        self.lock.acquire()
+        try:
+            self.generation += 1
+            old = self.entries.pop(viewId, None)
+            if old:
+                self.size -= old[1]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        "Forget every plan, for example when another database is opened"
+        self.lock.acquire()
+        try:
+            self.generation += 1
+            self.entries.clear()
+            self.size = 0
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        "Return a one line summary of the counters"
+        return "plan cache: %d hits, %d misses, %d views, %d bytes"%(
+                self.hits, self.misses, len(self.entries), self.size)
+
+
+def loadPlan(cache, store, viewId, decoder):    # {{{1
+    "Return the plan of viewId from cache or built from store, or None"
+    plan = cache.get(viewId)
+    if plan is None:
+        view = store.getNode(viewId)
+        if not view:
+            return None
+        plan = planView(view, decoder)
+        cache.put(viewId, plan, len(viewCodec.dumps(view)))
+    return plan
+
+
+def predictViews(viewId, neighbours, headers, count):   # {{{1
+    """Return up to count view ids likely to be restored soon
+
+    The selected viewId comes first, then its neighbours in the table and
+    then the newest views showing the same odb. headers maps view ids to
+    viewStore.viewHeader in database order.
+    """
+    predicted = []
+    seen = set()
+    for candidate in [viewId] + list(neighbours):
+        if candidate not in seen and headers.has_key(candidate):
+            seen.add(candidate)
+            predicted.append(candidate)
+    header = headers.get(viewId)
+    if header and header.odbNames:
+        odbNames = set(header.odbNames)
+        for other in reversed(headers.values()):
+            if len(predicted) >= count:
+                break
+            if other.id not in seen and odbNames.intersection(other.odbNames):
+                seen.add(other.id)
+                predicted.append(other.id)
+    return predicted[:count]
+
+
+class prefetchThread(threading.Thread):     # {{{1
+    """Build plans of views in the background and add them to a cache
+
+    reader is a generator function from the readNodes method of a
+    viewStore store, which copies what it needs so that the thread only
+    sees plain Python data and never an Abaqus object. Views with values
+    which cannot be decoded are left for the main thread to report.
+    """
+
+    def __init__(self, cache, reader, decoder):
+        threading.Thread.__init__(self, name='view prefetch')
+        self.setDaemon(True)
+        self.cache = cache
+        self.reader = reader
+        self.decoder = decoder
+        self.generation = cache.generation
+        self.cancelled = threading.Event()
+        self.count = 0  # plans added
+
+    def cancel(self):
+        "Stop after the current view, for example when the selection changes"
+        self.cancelled.set()
+
+    def run(self):
+        for viewId, node in self.reader():
+            if self.cancelled.isSet():
+                break
+            if self.cache.has(viewId):
+                continue
+            errors = []
+            plan = planView(node, self.decoder, errors)
+            if errors:
+                continue
+            if not self.cache.put(viewId, plan, len(viewCodec.dumps(node)),
+                    self.generation):
+                break   # renamed, deleted or another database was opened
+            self.count += 1
+
+
+if __name__ == '__main__':  # {{{1 Simulate a Views Manager session
+    import os
+    import time
+    import random
+    import tempfile
+    import viewStore
+
+    def leaves(count):
+        return ''.join(['<member%d>%s</member%d>'%(i,
+            ['ON', 'OFF', '0.5', "'Helvetica'", '(0.0, 0.0, 1.0)'][i%5], i)
+            for i in range(count)])
+
+    # Views similar to what saveXml stores with contours on
+    view = ('<userView id="%(id)s" name="view %(id)s" '
+        'dateTime="2011-03-23T17:33:30Z"><Viewport name="Viewport: 1">'
+        '<origin>(0.0, 0.0)</origin><width>281.25</width>'
+        '<viewportAnnotationOptions>' + leaves(45) +
+        '</viewportAnnotationOptions><view>' + leaves(7) + '</view>'
+        '<odbDisplay name="/scratch/Job-%(odb)d.odb">'
+        '<setPrimaryVariable><variableLabel type="argument">\'S\''
+        '</variableLabel></setPrimaryVariable><contourOptions>' +
+        leaves(70) + '</contourOptions><symbolOptions>' + leaves(45) +
+        '</symbolOptions><superimposeOptions>' + leaves(35) +
+        '</superimposeOptions><commonOptions>' + leaves(45) +
+        '</commonOptions></odbDisplay></Viewport></userView>')
+    count = 2000
+    fd, fileName = tempfile.mkstemp(suffix='.xml')
+    f = os.fdopen(fd, 'wb')
+    f.write(viewStore.prolog + '<userViews>')
+    for i in range(count):
+        f.write(view%{'id': viewStore.encode(i), 'odb': i%20})
+    f.write('</userViews>')
+    f.close()
+    store = viewStore.xmlStore(fileName)
+    ids = store.headers.keys()
+    decoder = viewCodec.valueDecoder({'ON': 'ON', 'OFF': 'OFF'})
+
+    # The user mostly steps through the table, sometimes jumps elsewhere
+    # and comes back, pausing between selecting a row and restoring it.
+    random.seed(1)
+    row = 0
+    session = []
+    for step in range(200):
+        move = random.random()
+        if move < 0.6:
+            row = min(row + 1, count - 1)
+        elif move < 0.75:
+            row = max(row - 1, 0)
+        elif move < 0.9 and session:
+            row = random.choice(session[-10:])[0]
+        else:
+            row = random.randrange(count)
+        session.append( (row, random.uniform(0.0, 0.02)) )
+
+    for label, keep, prefetch in [('no cache', False, False),
+            ('plan cache', True, False), ('cache and prefetch', True, True)]:
+        cache = planCache()
+        latencies = []
+        for row, idle in session:
+            if prefetch:
+                neighbours = [ids[r] for r in (row + 1, row - 1, row + 2)
+                        if 0 <= r < count]
+                predicted = [viewId for viewId in predictViews(ids[row],
+                    neighbours, store.headers, 8) if not cache.has(viewId)]
+                thread = prefetchThread(cache, store.readNodes(predicted),
+                        decoder)
+                thread.start()
+            time.sleep(idle)    # the user decides to restore the view
+            start = time.time()
+            plan = loadPlan(cache, store, ids[row], decoder)
+            latencies.append(time.time() - start)
+            if prefetch:
+                thread.cancel()
+                thread.join()
+            if not keep:
+                cache.clear()
+        latencies.sort()
+        print "%-18s mean %6.2f ms, median %6.2f ms, 95%% %6.2f ms, " \
+                "%d hits"%(label, 1e3*sum(latencies)/len(latencies),
+                1e3*latencies[len(latencies)//2],
+                1e3*latencies[int(0.95*len(latencies))], cache.hits)
+    os.remove(fileName)
+    if os.path.exists(fileName + viewStore.indexSuffix):
+        os.remove(fileName + viewStore.indexSuffix)
@@ -2,51 +2,72 @@
 
 import viewsCommon
 import abaqus
+import abaqusConstants
 from abaqusConstants import *
 import customKernel # for registered list of userViews
 import os
+import re
 import sys
+import time
+import marshal
 from xml.dom import minidom
+import viewStore
+import viewCodec
+import viewPlan
+import viewSearch
+import thumbCache
+import views
+from viewCodec import TAG, ATTRIBUTES, TEXT, CHILDREN
 try:
     from xml.utils import iso8601 # date/time support
 except ImportError:
     import isoDateTime as iso8601
 
-xmldoc = None
+store = None    # viewStore.xmlStore or sqliteStore of the current database
+storeGeneration = 0     # store.generation shown in the GUI
 xmlFileName = None
+viewIndex = viewSearch.searchIndex()    # search index of the store headers
+searchQuery = ''    # last query from the GUI; results follow changes
+thumbnails = None   # thumbCache.thumbCache of the current database
+pendingThumbnail = None     # (view id, canvas objects) of the view being printed
+plans = viewPlan.planCache(viewsCommon.planCacheEntries,
+        viewsCommon.planCacheMemory)    # decoded views recently restored
+prefetcher = None   # viewPlan.prefetchThread decoding likely next views
+constants = dict(vars(abaqusConstants))
+constants.update({'True': True, 'False': False, 'None': None})
+decoder = viewCodec.valueDecoder(constants)   # replaces eval() of saved values
 debug = os.environ.get('DEBUG')
 if debug:
     print "viewSave Debug mode is on"
 
 # {{{1 Utility functions ######################################################
 
-def encode(value, chars="abcdefghijklmnopqrstuvwxyz"):  # {{{2
-    "Return the int value encoded into arbitrary base defined by chars."
-    if not value:
-        return chars[0]
-    base = len(chars)
-    converted = []
-    while(value):
-        value, remainder = divmod(value, base)
-        converted.append(chars[remainder])
-    converted.reverse()
-    return ''.join(converted)
-
-
-def getUniqueId(xmlElement):    # {{{2
-    "Return a unique id for this xmlElement, creating one if necessary."
-    import random
-    id = xmlElement.getAttribute('id')
-    if not id:
-        doc = xmlElement.ownerDocument
-        maxid = 2*len(doc.documentElement.childNodes)
-        intid = random.randint(0, maxid)
-        id = encode(intid)
-        while doc.getElementById(id):
-            intid = random.randint(0, maxid)
-            id = encode(intid)
-        xmlElement.setAttribute('id', id)
-    return id
+def abaqusRelease():    # {{{2
+    "Return the Abaqus version string, for example '6.14-1'"
+    return '%s.%s-%s'%(abaqus.majorVersion, abaqus.minorVersion,
+            abaqus.updateVersion)
+
+
+floatTolerance = 1e-6   # relative difference of floats considered unchanged
+
+def sameValue(a, b):    # {{{2
+    "Return True if a and b are equal, allowing for float round-off."
+    if isinstance(a, float) or isinstance(b, float):
+        try:
+            return abs(a - b) <= floatTolerance*max(1.0, abs(a), abs(b))
+        except TypeError:
+            return False
+    if isinstance(a, (tuple, list)) and isinstance(b, (tuple, list)):
+        if len(a) != len(b):
+            return False
+        for x, y in zip(a, b):
+            if not sameValue(x, y):
+                return False
+        return True
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
 
 
 def addLeaf(xmlElement, key, value=None, attrs={}): # {{{2
@@ -191,6 +212,45 @@ knownObjects = {    # {{{2 What to save from each element type
 
 skipMembers = ['autoDeformationScaleValue', 'autoMaxValue', 'autoMinValue', 'name']
  
+discoveredObjects = {}  # members found by introspection, cached in schemaFileName
+
+
+def schemaKey():    # {{{2
+    "Return the key which must match for the cached schema to be valid"
+    return (abaqusRelease(), str(viewsCommon.__version__))
+
+
+def loadSchema():   # {{{2
+    "Add members discovered in earlier sessions of this release to knownObjects"
+    try:
+        f = open(viewsCommon.schemaFileName, 'rb')
+        try:
+            key, members = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return  # no cache yet
+    if key != schemaKey():
+        return  # cache belongs to another Abaqus or plugin version
+    for typeName, names in members.items():
+        if not knownObjects.has_key(typeName):
+            knownObjects[typeName] = list(names)
+            discoveredObjects[typeName] = tuple(names)
+    if debug:
+        print "Loaded schema for %d object types"%len(members)
+
+
+def saveSchema():   # {{{2
+    "Store members discovered by introspection for the next session"
+    try:
+        f = open(viewsCommon.schemaFileName, 'wb')
+        try:
+            marshal.dump((schemaKey(), discoveredObjects), f)
+        finally:
+            f.close()
+    except IOError:
+        print "Could not write", viewsCommon.schemaFileName
+
 
 def saveXml(xmlElement, abaqusObject):  # {{{2
     "Recursively read abaqus data and store in xml dom."
@@ -213,6 +273,8 @@ def saveXml(xmlElement, abaqusObject):  # {{{2
                 members.append(a)
         if debug:
             print "unknownObject %r has members %r"%(typeName, members)
+        discoveredObjects[typeName] = tuple(members)
+        saveSchema()
 
     if len(members):
         # Complex type with data members
@@ -230,132 +292,275 @@ def saveXml(xmlElement, abaqusObject):  # {{{2
             xmlElement.ownerDocument.createTextNode(repr(abaqusObject)))
 
 
-def addSessionUserView(xmlView):    # {{{2 Update customData.userViews for the GUI
-    "Add a view to the session.customData"
-    id = str(getUniqueId(xmlView))
-    name = str(xmlView.getAttribute('name'))
-    datestr = xmlView.getAttribute('dateTime')
-    userData = xmlView.getElementsByTagName('userData')
-    if datestr:
+localDates = {}     # cache of iso8601 dateTime: local time string
+
+
+def localDate(datestr):  # {{{2
+    "Return the iso8601 datestr formatted in local time"
+    if not datestr:
+        return datestr
+    if not localDates.has_key(datestr):
         dateTime = iso8601.parse(datestr)
         localtime = iso8601.time.localtime(dateTime)
-        datestr = iso8601.time.strftime('%Y-%m-%d %H:%M', localtime)
-    if userData:
+        localDates[datestr] = iso8601.time.strftime('%Y-%m-%d %H:%M', localtime)
+    return localDates[datestr]
+
+
+def sessionRows(header):    # {{{2
+    "Return the customData.userViews rows which describe the view header"
+    datestr = localDate(header.dateTime)
+    if header.annotation:
         ud = '*'
     else:
         ud = ''
-    for od in xmlView.getElementsByTagName("odbDisplay"):
-        odbName = str(od.getAttribute('name'))
-        abaqus.session.customData.userViews.append(
-                (id, name, datestr, odbName, ud) )
+    return [(header.id, header.name, datestr, odbName, ud)
+            for odbName in header.odbNames]
+
+
+def addSessionUserViews(headers):    # {{{2 Update customData.userViews for the GUI
+    "Add views to the session.customData with a single notification"
+    rows = []
+    for header in headers:
+        rows.extend(sessionRows(header))
+        viewIndex.add(header)
+    if rows:
+        abaqus.session.customData.userViews.extend(rows)
+        updateSearch()
+
+
+def setSessionUserViews(rows):    # {{{2
+    "Replace all rows of session.customData with a single notification"
+    abaqus.session.customData.userViews[:] = rows
+
+
+def addSessionUserView(header):    # {{{2
+    "Add a view to the session.customData"
+    addSessionUserViews([header])
+
+
+def regexSearch(query):    # {{{2
+    "Return set of ids whose table rows match regular expression query"
+    try:
+        regex = re.compile(query, re.IGNORECASE)
+    except re.error:
+        return None     # incomplete expression
+    return set([header.id for header in store.headers.values()
+        for row in sessionRows(header) if regex.search(' '.join(row))])
+
+
+def updateSearch():    # {{{2 Update customData.userViewMatches for the GUI
+    "Replace the ids matching searchQuery with a single notification"
+    matches = viewIndex.search(searchQuery)
+    if store and viewSearch.isRegex(searchQuery, matches):
+        found = regexSearch(searchQuery)
+        if found is not None:
+            matches = found
+    if matches is None:
+        matches = ()    # no query
+    abaqus.session.customData.userViewMatches[:] = sorted(matches)
+
+
+def searchViews(query):    # {{{2
+    "Find views matching query as described in viewSearch"
+    global searchQuery
+    searchQuery = query
+    updateSearch()
 
 
 # {{{1 Functions to restore a view from the database ##########################
 
 def restoreXml(xmlElement, abaqusObject):
     "Recursively extract xml data and set abaqus values"
+    return restoreNode(viewCodec.fromXml(xmlElement), abaqusObject)
+
+
+restoreStats = dict.fromkeys(['calls', 'callsSkipped', 'members', 'membersSkipped',
+    'redraws', 'redrawsSuppressed'], 0)
+
+
+def resetRestoreStats():    # {{{2
+    "Clear the counters of setValues calls made and skipped"
+    for key in restoreStats.keys():
+        restoreStats[key] = 0
+
+
+def printRestoreStats():    # {{{2
+    "Report how much of the restore was skipped because nothing changed"
+    print "setValues: %(calls)d calls (%(callsSkipped)d skipped), " \
+            "%(members)d members (%(membersSkipped)d unchanged), " \
+            "%(redraws)d redraws (%(redrawsSuppressed)d suppressed)"%restoreStats
+    print plans.stats()
+
+
+def restoreNode(node, abaqusObject):    # {{{2
+    "Recursively extract viewCodec node data and set abaqus values"
+    applyPlan(viewPlan.buildPlan(node, decoder), abaqusObject)
+    return node[TEXT].strip()
+
+
+def applyPlan(plan, abaqusObject):    # {{{2
+    "Call or set values of abaqusObject and its members as described by plan"
+    tag, arguments, planValues, children = plan
     if callable(abaqusObject):
-        arguments=dict([ (str(key), str(value))
-            for key, value in xmlElement.attributes.items() ])
-        for xmlChild in xmlElement.childNodes:
-            if xmlChild.ELEMENT_NODE == xmlChild.nodeType and \
-                    xmlChild.getAttribute('type') == u'argument':
-                        arguments[str(xmlChild.tagName)] = \
-                                eval(restoreXml(xmlChild, None))
         if debug:
-            print xmlElement.tagName, "( %r )"%arguments
+            print tag, "( %r )"%arguments
         try:
             abaqusObject = abaqusObject(**arguments)
         except: # TODO better error checking!
             if arguments.has_key('name'):
                 abaqusObject = abaqusObject(name=arguments['name'])
-
-    setValues = {}
-    text = ''
-    for xmlChild in xmlElement.childNodes:
-        if xmlChild.ELEMENT_NODE == xmlChild.nodeType and \
-            not len(xmlChild.getAttribute('type')):
-                abaqusChild = getattr(abaqusObject, xmlChild.tagName, None)
-                value = restoreXml(xmlChild, abaqusChild)
-                if len(value):
-                    setValues[str(xmlChild.tagName)] = eval(value)
-        elif xmlChild.TEXT_NODE == xmlChild.nodeType:
-            text += xmlChild.data
-
-    if len(setValues) and hasattr(abaqusObject, 'setValues'):
+        views.countChange()
+
+    for child in children:
+        abaqusChild = getattr(abaqusObject, child[viewPlan.TAG], None)
+        if abaqusChild is not None:
+            applyPlan(child, abaqusChild)
+
+    if len(planValues) and hasattr(abaqusObject, 'setValues'):
+        # Only send the members which differ from the current values
+        setValues = {}
+        for key, value in planValues:
+            if hasattr(abaqusObject, key) and \
+                    sameValue(getattr(abaqusObject, key), value):
+                restoreStats['membersSkipped'] += 1
+            else:
+                setValues[key] = value
+        if not len(setValues):
+            restoreStats['callsSkipped'] += 1
+            return
         if debug:
-            print xmlElement.tagName, ".setValues %r"%setValues
+            print tag, ".setValues %r"%setValues
+        restoreStats['calls'] += 1
+        restoreStats['members'] += len(setValues)
         try:
             abaqusObject.setValues(**setValues)
         except TypeError:
-            print xmlElement.tagName, sys.exc_info()[1]
+            print tag, sys.exc_info()[1]
+        else:
+            views.countChange()
+
+
+def getPlan(viewId):    # {{{2
+    "Return the decoded plan of viewId, from the cache if possible, or None"
+    plan = viewPlan.loadPlan(plans, store, viewId, decoder)
+    checkStore()
+    return plan
+
 
-    return text.strip()
+def prefetchViews(viewId, neighbours=()):    # {{{2
+    """Decode the selected view and those likely to follow in the background
+
+    Called by viewManagerDB when the selection stays unchanged for a moment.
+    """
+    global prefetcher
+    if prefetcher:
+        prefetcher.cancel()     # the selection has moved on
+    if not store:
+        return
+    predicted = [candidate for candidate in viewPlan.predictViews(viewId,
+        neighbours, store.headers, viewsCommon.prefetchCount)
+        if not plans.has(candidate)]
+    if predicted:
+        reader = store.readNodes(predicted)
+        checkStore()    # before the thread reads the cache generation
+        prefetcher = viewPlan.prefetchThread(plans, reader, decoder)
+        prefetcher.start()
+
+def makeThumbnails(viewIds):   # {{{2
+    """Make missing thumbnails of views printed before the cache existed
+
+    Called by viewManagerDB for the views in the rows it is showing.
+    """
+    if not store or not thumbnails:
+        return
+    candidates = [(viewId, store.headers[viewId].name + '.png')
+            for viewId in viewIds if store.headers.has_key(viewId)]
+    thumbCache.rebuild(thumbnails, candidates, viewsCommon.thumbnailSize)
 
 # {{{1 File access functions ##################################################
 
 def readXmlFile(fileName):  # {{{2
-    "Read fileName into xmldoc or create a new xmldoc if necessary"
-    global xmldoc, xmlFileName
-    if os.path.exists(fileName):
-        doc = minidom.parse(fileName)
-    else:
-        # Create a new document
-        doc = minidom.parseString('<?xml version="1.0" ?>\n'
-            '<!DOCTYPE userViews [<!ATTLIST userView id ID #IMPLIED>]>\n'
-            '<!-- Saved settings for the View Manager Abaqus plugin -->\n'
-            '<userViews />')
-#        impl = minidom.getDOMImplementation()
-#        doctype = impl.createDocumentType(
-#                qualifiedName="userViews",
-#                publicId=None,
-#                systemId=None)
-#        doctype.internalSubset=u'<!ATTLIST userView id ID #IMPLIED>'
-#        doc = impl.createDocument(
-#                namespaceURI=None,
-#                qualifiedName="userViews",
-#                doctype=doctype)
-        doc.changed = 1
-    fileType = doc.documentElement.tagName
-    if not "userViews" == fileType:
+    "Index fileName into the store or create a new store if necessary"
+    global store, xmlFileName, thumbnails
+    try:
+        newStore = viewStore.openStore(fileName,
+                journalLimit=viewsCommon.journalLimit)
+    except viewStore.formatError:
         return abaqus.getWarningReply(
-                '%r is not userViews file format'%fileType,
+                '%r is not userViews file format'%str(sys.exc_info()[1]),
                 (abaqus.CANCEL, ))
     writeXmlFile()  # save any updates to the old document
-    xmldoc = doc
+    store = newStore
     xmlFileName = fileName
-    # Clear the old list items (if any)
-    while len(abaqus.session.customData.userViews) > 0:
-        del abaqus.session.customData.userViews[0]
-    # Add new views
-    for view in xmldoc.getElementsByTagName("userView"):
-        addSessionUserView(view)
+    thumbnails = thumbCache.thumbCache(viewsCommon.thumbnailDirectory,
+            fileName)
+    abaqus.session.customData.userViewsFile[:] = [os.path.abspath(fileName)]
+    showStore()
+
+
+def showStore():    # {{{2
+    "Show all views of the store in the GUI and index them for searching"
+    global viewIndex, storeGeneration
+    storeGeneration = store.generation
+    plans.clear()
+    viewIndex = viewSearch.searchIndex(store.headers.values())
+    # Replace the old list items (if any) with the new views
+    rows = []
+    for header in store.headers.values():
+        rows.extend(sessionRows(header))
+    setSessionUserViews(rows)
+    updateSearch()
+
+
+def checkStore():   # {{{2
+    "Show the views again if the store has read changes of another session"
+    if store and store.generation != storeGeneration:
+        showStore()
 
 
 def writeXmlFile(fileName=None): # {{{2
     "Save the xml document to fileName"
-    if not hasattr(xmldoc, 'changed'):
-        return
-    if not fileName:
-        fileName=xmlFileName
-    bkupName = fileName + '~'
-    open(bkupName, 'w').write(xmldoc.toxml())
-    if os.path.exists(fileName):
-        os.remove(fileName)
-    os.rename(bkupName, fileName)
-    delattr(xmldoc, 'changed')
+    if store:
+        store.write(fileName)
+        checkStore()
+
+
+def compactXmlFile(): # {{{2
+    "Merge the journal of recent changes into the xml document"
+    if store:
+        store.compact()
+        checkStore()
+
+
+def importXmlFile(fileName): # {{{2
+    "Add all views from another xml or sqlite database to the current one"
+    try:
+        source = viewStore.openStore(fileName)
+    except viewStore.formatError:
+        return abaqus.getWarningReply(
+                '%r is not userViews file format'%str(sys.exc_info()[1]),
+                (abaqus.CANCEL, ))
+    addSessionUserViews([store.addView(source.getView(viewId))
+        for viewId in source.headers.keys()])
+    writeXmlFile()
+
+
+def exportXmlFile(fileName): # {{{2
+    "Copy all views into a new xml or sqlite database named fileName"
+    viewStore.copyViews(store, viewStore.openStore(fileName)).write()
 
 
 # {{{1 Abaqus/Viewer plugin functions #########################################
 
 def printToFileCallback(callingObject, args, kws, user):    # {{{2
     "Add a new userView to the xml document"
+    global pendingThumbnail
+    if views.printingFrames:
+        return  # printed by views or printViews; not a new view
 
-    userView = addLeaf(xmldoc.documentElement, 'userView')
+    userView = minidom.Document().createElement('userView')
     userView.setAttribute('name', kws['fileName'])
-    userView.setAttribute('abaqusViewer',
-            '%s.%s-%s'%(abaqus.majorVersion, abaqus.minorVersion,
-                abaqus.updateVersion))
+    userView.setAttribute('abaqusViewer', abaqusRelease())
     now = iso8601.time.time()
     userView.setAttribute('dateTime', iso8601.tostring(now))
     userView.setAttribute('version', str(viewsCommon.__version__))
@@ -369,99 +574,227 @@ def printToFileCallback(callingObject, args, kws, user):    # {{{2
                     saveXml(odbElement, odb)
             vpElement = addLeaf(userView, 'Viewport')
             saveXml(vpElement, object)
-    addSessionUserView(userView) # pass to gui
-    xmldoc.changed = 1
+    header = store.addView(userView)
+    addSessionUserView(header) # pass to gui
     writeXmlFile()
+    pendingThumbnail = (header.id, kws['canvasObjects'])
 
 
+def printedCallback(callingObject, args, kws, user):    # {{{2
+    "Make the thumbnail of the view saved by printToFileCallback"
+    global pendingThumbnail
+    if views.printingFrames or not pendingThumbnail:
+        return
+    viewId, canvasObjects = pendingThumbnail
+    pendingThumbnail = None
+    try:
+        saveThumbnail(viewId, canvasObjects)
+    except (IOError, OSError):
+        print "Thumbnail not saved:", sys.exc_info()[1]
+
+
+def saveThumbnail(viewId, canvasObjects):   # {{{2
+    "Print canvasObjects at thumbnail size into the cache"
+    if not os.path.isdir(thumbnails.directory):
+        os.makedirs(thumbnails.directory)
+    fileName = os.path.join(thumbnails.directory, 'print%d'%os.getpid())
+    options = abaqus.session.pngOptions
+    imageSize = options.imageSize
+    views.printingFrames = True    # this print is not a new view
+    try:
+        options.setValues(imageSize=viewsCommon.thumbnailSize)
+        abaqus.session.printToFile(fileName=fileName, format=PNG,
+                canvasObjects=canvasObjects)
+    finally:
+        options.setValues(imageSize=imageSize)
+        views.printingFrames = False
+    f = open(fileName + '.png', 'rb')
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    os.remove(fileName + '.png')
+    thumbnails.put(viewId, data)
+
+
+def restoreView(plan):  # {{{2 Restore the viewports of a view plan
+    "Apply the viewport plans of viewPlan.planView; return viewports restored"
+    resetRestoreStats()
+    vpPlans = plan[3]
+    vpObject = abaqus.session.viewports.values()[0]  # current viewport
+    restored = []
+    redraws = views.redrawCount
+    suppressed = views.suppressedRedraws
+    if len(vpPlans) > 1:
+        for vpname, vpPlan in vpPlans:
+            if abaqus.session.viewports.has_key(vpname):
+                vpObject = abaqus.session.viewports[vpname]
+            else:
+                # Create viewports as necessary for the userView
+                odb = abaqus.session.odbs[vpObject.odbDisplay.name]
+                vpObject = abaqus.session.Viewport(name=vpname)
+                vpObject.setValues(displayedObject=odb)
+            with views.deferredRedraw([vpObject], counted=True):
+                applyPlan(vpPlan, vpObject)
+            restored.append(vpObject)
+    elif len(vpPlans) == 1:
+        # apply settings to the current viewport
+        with views.deferredRedraw([vpObject], counted=True):
+            applyPlan(vpPlans[0][1], vpObject)
+        restored.append(vpObject)
+    else:
+        print "No viewports defined."
+    restoreStats['redraws'] = views.redrawCount - redraws
+    restoreStats['redrawsSuppressed'] = views.suppressedRedraws - suppressed
+    return restored
+
 def setView(viewId):    # {{{2 Restore the specified xml userview Id
     """Retrieve the xmlElement for the identified userView.
 
     Called by viewManagerForm when executing the form command.
     """
-    xmlView = xmldoc.getElementById(viewId)
-    if not xmlView:
+    plan = getPlan(viewId)
+    if not plan:
         print "View %r not in userViews database."%viewId
     else:
-        datestr = xmlView.getAttribute('dateTime')
-        if datestr:
-            dateTime = iso8601.parse(datestr)
-            localtime = iso8601.time.localtime(dateTime)
-            datestr = iso8601.time.strftime('%Y-%m-%d %H:%M', localtime)
-        print xmlView.getAttribute('name'), datestr
-        vps = xmlView.getElementsByTagName('Viewport')
-        vpObject = abaqus.session.viewports.values()[0]  # current viewport
-        if len(vps) > 1:
-            for vpElement in vps:
-                vpname = str(vpElement.getAttribute('name'))
-                if abaqus.session.viewports.has_key(vpname):
-                    vpObject = abaqus.session.viewports[vpname]
-                else:
-                    # Create viewports as necessary for the userView
-                    odb = abaqus.session.odbs[vpObject.odbDisplay.name]
-                    vpObject = abaqus.session.Viewport(name=vpname)
-                    vpObject.setValues(displayedObject=odb)
-                restoreXml(vpElement, vpObject)
-        elif len(vps) == 1:
-            vpElement = vps[0]
-            # restoreXml settings to the current viewport
-            restoreXml(vpElement, vpObject)
+        name, dateTime, sortKey, vpPlans = plan
+        print name, localDate(dateTime)
+        restoreView(plan)
+        printRestoreStats()
+
+def displayOdb(vpObject, odbName):  # {{{2
+    "Display odbName in vpObject unless it is already shown"
+    if getattr(vpObject.odbDisplay, 'name', None) == odbName:
+        return
+    if abaqus.session.odbs.has_key(odbName):
+        odb = abaqus.session.odbs[odbName]
+    elif os.path.exists(odbName):
+        odb = abaqus.session.openOdb(name=odbName, readOnly=True)
+    else:
+        print "Odb %r is not available."%odbName
+        return
+    vpObject.setValues(displayedObject=odb)
+
+unsafeFileChars = re.compile(r'[^\w.-]+')
+
+def printViews(viewIds=None, name=None, odbName=None, directory='',
+        format=PNG, switchOdb=True):    # {{{2 Restore and print many userViews
+    """Restore each view and print it to a file named after the view.
+
+    Views are given by viewIds or selected by shell-style patterns as in
+    findViews. They are sorted by odb and primary variable so consecutive
+    views change as little as possible. The saved odb is displayed first
+    unless switchOdb is False. Return list of (viewId, fileName, seconds).
+    """
+    if viewIds is None:
+        viewIds = store.findViews(name=name, odbName=odbName)
+    selected = []
+    for viewId in viewIds:
+        plan = getPlan(viewId)
+        if plan:
+            selected.append( (plan[2], viewId, plan) )
         else:
-            print "No viewports defined."
+            print "View %r not in userViews database."%viewId
+    selected.sort()
+
+    printed = []
+    start = time.time()
+    views.printingFrames = True    # printed views are already saved
+    try:
+        for count, (key, viewId, plan) in enumerate(selected):
+            viewStart = time.time()
+            odbNames = key[0]
+            if switchOdb and 1 == len(odbNames):
+                displayOdb(abaqus.session.viewports.values()[0], odbNames[0])
+            restored = restoreView(plan)
+            if not restored:
+                continue
+            viewName = plan[0] or ''
+            fileName = os.path.join(directory, '%s-%s'%(
+                unsafeFileChars.sub('_', viewName).strip('_'), viewId))
+            abaqus.session.printToFile(fileName=fileName, format=format,
+                    canvasObjects=tuple(restored))
+            seconds = time.time() - viewStart
+            printed.append( (viewId, fileName, seconds) )
+            print "%d/%d %s: %.2f s (%d setValues calls, %d skipped)"%(
+                    count + 1, len(selected), fileName, seconds,
+                    restoreStats['calls'], restoreStats['callsSkipped'])
+    finally:
+        views.printingFrames = False
+    print "Printed %d views in %.1f s"%(len(printed), time.time() - start)
+    print plans.stats()
+    return printed
+
+def viewCamera(viewId):    # {{{2 Camera of the first viewport in a userView
+    "Return (position, target, up, width) saved in the view or None"
+    plan = getPlan(viewId)
+    if not plan:
+        return None
+    for vpname, vpPlan in plan[3]:
+        for child in vpPlan[viewPlan.CHILDREN]:
+            if 'view' != child[viewPlan.TAG]:
+                continue
+            members = dict(child[viewPlan.SETVALUES])
+            try:
+                return tuple([members[name] for name in
+                    ('cameraPosition', 'cameraTarget', 'cameraUpVector',
+                        'width')])
+            except KeyError:
+                return None
+    return None
 
 def setAnnotation(viewId):    # {{{2 Restore annotations from the specified xml userview Id
     """Retrieve the xmlElement for the identified userView.
 
     Called by viewManagerDB to restore saved annotations.
     """
-    xmlView = xmldoc.getElementById(viewId)
-    if not xmlView:
+    view = store.getNode(viewId)
+    if not view:
         print "View %r not in userViews database."%viewId
         return
-    datestr = xmlView.getAttribute('dateTime')
-    if datestr:
-        dateTime = iso8601.parse(datestr)
-        localtime = iso8601.time.localtime(dateTime)
-        datestr = iso8601.time.strftime('%Y-%m-%d %H:%M', localtime)
-    print xmlView.getAttribute('name'), datestr
-    xmlUserData = xmlView.getElementsByTagName('userData')
-    if not xmlUserData:
+    print view[ATTRIBUTES].get('name'), localDate(view[ATTRIBUTES].get('dateTime'))
+    userDataNodes = viewCodec.findAll(view, 'userData')
+    if not userDataNodes:
         print "View does not contain annotations."
         return
 
     vpObject = abaqus.session.viewports.values()[0]  # current viewport
     userData = abaqus.session.odbs[vpObject.odbDisplay.name].userData
-    restoreXml(xmlUserData[0], userData)    # XXX only reads first value
-    for ann in userData.annotations.values():    # TODO only plot new annotations
-        vpObject.plotAnnotation(ann)
+    with views.deferredRedraw([vpObject]):
+        restoreNode(userDataNodes[0], userData)    # XXX only reads first value
+        for ann in userData.annotations.values():    # TODO only plot new annotations
+            vpObject.plotAnnotation(ann)
 
 def deleteViews(viewIds):   # {{{2 Delete a userview from the database
     "Remove the specified views from the database."
+    deleted = set()
     for viewId in viewIds:
-        xmlView = xmldoc.getElementById(viewId)
-        if xmlView:
-            xmlView.parentNode.removeChild(xmlView)
-            xmlView.unlink()
-            xmldoc.changed = 1
+        if store.deleteView(viewId):
+            deleted.add(viewId)
+            viewIndex.remove(viewId)
+            plans.discard(viewId)
         else:
             print "View %r not in userViews database."%viewId
-    for view in reversed(abaqus.session.customData.userViews):
-        if view[0] in viewIds:
-            abaqus.session.customData.userViews.remove(view)
+    if deleted:
+        setSessionUserViews([row for row in abaqus.session.customData.userViews
+            if not row[0] in deleted])
+        updateSearch()
 
    
 def renameView(viewId, name):   # {{{2 Rename a userview
     "Modify the view name in the database."
-    xmlView = xmldoc.getElementById(viewId)
-    if xmlView:
-        xmlView.setAttribute('name', name)
-        views = abaqus.session.customData.userViews
-        for rownum, row in enumerate(views):
+    if store.renameView(viewId, name):
+        viewIndex.add(store.headers[viewId])
+        plans.discard(viewId)
+        rows = []
+        for row in abaqus.session.customData.userViews:
             if row[0] == viewId:
                 copy = list(row)
                 copy[1] = name
-                views[rownum] = tuple(copy)
-        xmldoc.changed = 1
+                row = tuple(copy)
+            rows.append(row)
+        setSessionUserViews(rows)
+        updateSearch()
     else:
         print "View %r not in userViews database."%viewId
 
@@ -476,9 +809,19 @@ def init(): # {{{2
     # Add to session.customData
     if not hasattr(abaqus.session.customData, "userViews"):
         abaqus.session.customData.userViews = customKernel.RegisteredList()
+    if not hasattr(abaqus.session.customData, "userViewMatches"):
+        abaqus.session.customData.userViewMatches = \
+                customKernel.RegisteredList()
+    if not hasattr(abaqus.session.customData, "userViewsFile"):
+        # Absolute path of the database, for its thumbnails in the GUI
+        abaqus.session.customData.userViewsFile = \
+                customKernel.RegisteredList()
+    loadSchema()
     readXmlFile(viewsCommon.xmlFileName)
 
     print __name__, 'addCallback printToFile'
     methodCallback.addCallback(type(abaqus.session), 'printToFile', 
             printToFileCallback)
+    methodCallback.addCallback(type(abaqus.session), 'printToFile',
+            printedCallback, callAfter=True)
 
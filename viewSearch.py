@@ -0,0 +1,205 @@
+"""Inverted index for searching saved userViews
+
+Each view header is split into lower case alphanumeric tokens per field:
+name, odb, var (primary and deformed variable labels), cut (view cut
+names), text (annotation text) and id. The date field holds the local
+date and time the view was saved as a single yyyymmddhhmm token, matched
+by the digits of a term as a prefix. A query is a list of terms which
+must all match:
+
+    bracket             any field has a token starting with "bracket"
+    var:S odb:bracket*  field qualified; "*" makes the last token a prefix
+    "job-1"             every token of a term must match
+    date:2011-03        saved in March 2011
+
+The index answers queries from sorted token lists without visiting each
+view. Queries written as regular expressions, and plain text which is
+not the start of any token, are left for the caller to match against the
+text of each view as the Views Manager filter did before; see isRegex.
+
+$Id$
+"""
+
+import re
+import time
+import bisect
+import isoDateTime
+
+fields = ('name', 'odb', 'var', 'cut', 'text', 'id', 'date')
+tokenRe = re.compile(r'[a-z0-9]+')
+termRe = re.compile(r'(?:(\w+):)?("[^"]*"?|\S+)')
+digitRe = re.compile(r'\d+')
+regexRe = re.compile(r'[\\^$+?{}\[\]|()]|\.[*+?]')   # not plain search terms
+
+
+def tokenize(text):     # {{{1
+    "Return list of lower case alphanumeric tokens of text"
+    return tokenRe.findall(text.lower())
+
+
+def dateToken(dateTime):    # {{{1
+    "Return the iso8601 dateTime as local yyyymmddhhmm or None"
+    if not dateTime:
+        return None     # view saved without a date
+    try:
+        secs = isoDateTime.parse(dateTime)
+        if secs is None:
+            return None
+        return time.strftime('%Y%m%d%H%M', time.localtime(secs))
+    except (TypeError, ValueError, OverflowError):
+        return None     # date could not be parsed
+
+
+def headerTerms(header):    # {{{1
+    "Return set of (field, token) pairs describing a viewStore.viewHeader"
+    values = [('name', header.name), ('id', header.id)]
+    values.extend([('odb', odbName) for odbName in header.odbNames])
+    values.extend(header.keywords)
+    terms = set([(field, token) for field, text in values
+        for token in tokenRe.findall(text.lower())])
+    date = dateToken(header.dateTime)
+    if date:
+        terms.add( ('date', date) )
+    return terms
+
+
+def isRegex(query, matches):    # {{{1
+    """Return True if query should be matched as a regular expression
+
+    That is if it uses regular expression syntax, or if it is unqualified
+    text and the index found nothing for it, for example part of a word.
+    """
+    if regexRe.search(query):
+        return True
+    if matches or not query.strip():
+        return False
+    return not [field for field, value in termRe.findall(query)
+            if field.lower() in fields]
+
+
+class searchIndex:  # {{{1
+    "Map tokens of each field to the ids of the views containing them"
+
+    def __init__(self, headers=()):
+        self.postings = {}  # (field, token): set of view ids
+        self.tokens = dict([(field, []) for field in fields])   # sorted
+        self.terms = {}     # view id: (field, token) pairs for removal
+        for header in headers:
+            # Sort the token lists once at the end instead of inserting
+            terms = self.terms[header.id] = headerTerms(header)
+            for term in terms:
+                self.postings.setdefault(term, set()).add(header.id)
+        for field, token in self.postings.keys():
+            self.tokens.setdefault(field, []).append(token)
+        for tokens in self.tokens.values():
+            tokens.sort()
+
+    def add(self, header):
+        "Index the view header, replacing any previous entry"
+        if self.terms.has_key(header.id):
+            self.remove(header.id)
+        terms = headerTerms(header)
+        self.terms[header.id] = terms
+        for term in terms:
+            ids = self.postings.get(term)
+            if ids is None:
+                ids = self.postings[term] = set()
+                field, token = term
+                bisect.insort(self.tokens.setdefault(field, []), token)
+            ids.add(header.id)
+
+    def remove(self, viewId):
+        "Forget the view; return False if it was not indexed"
+        terms = self.terms.pop(viewId, None)
+        if terms is None:
+            return False
+        for term in terms:
+            ids = self.postings[term]
+            ids.discard(viewId)
+            if not ids:
+                del self.postings[term]
+                field, token = term
+                tokens = self.tokens[field]
+                del tokens[bisect.bisect_left(tokens, token)]
+        return True
+
+    def lookup(self, field, token, prefix=False):
+        "Return set of ids with token in field, or any token starting with it"
+        if not prefix:
+            return set(self.postings.get((field, token), ()))
+        found = set()
+        tokens = self.tokens.get(field, [])
+        i = bisect.bisect_left(tokens, token)
+        while i < len(tokens) and tokens[i].startswith(token):
+            found.update(self.postings[(field, tokens[i])])
+            i += 1
+        return found
+
+    def search(self, query):
+        "Return set of view ids matching every term of query, or None if empty"
+        result = None
+        for field, value in termRe.findall(query):
+            if field.lower() in fields:
+                searchFields = [field.lower()]
+                prefix = value.endswith('*')
+            else:
+                if field:
+                    value = field + ':' + value   # e.g. a drive letter
+                searchFields = fields
+                prefix = not value.endswith('"')    # quoted means whole token
+            found = None    # views matching every token of the term
+            tokens = tokenize(value)
+            for i, token in enumerate(tokens):
+                isPrefix = prefix and i == len(tokens) - 1
+                ids = set()
+                for searchField in searchFields:
+                    if 'date' != searchField:
+                        ids.update(self.lookup(searchField, token, isPrefix))
+                if found is None:
+                    found = ids
+                else:
+                    found &= ids
+            digits = ''.join(digitRe.findall(value))
+            if 'date' in searchFields and digits:
+                # The whole term, such as 2011-03-23, is a date prefix
+                dates = self.lookup('date', digits, True)
+                if found is None:
+                    found = dates
+                else:
+                    found |= dates
+            if found is None:
+                continue
+            if result is None:
+                result = found
+            else:
+                result &= found
+            if not result:
+                return result
+        return result
+
+
+if __name__ == '__main__':  # {{{1 Time building and searching an index
+    import time
+    import viewStore
+    variables = ['S', 'U', 'PEEQ', 'LE', 'RF', 'CPRESS']
+    headers = [viewStore.viewHeader(viewStore.encode(i),
+            name='model%d load case %d'%(i%97, i%13),
+            dateTime='2011-%02d-%02dT17:33:30Z'%(1 + i%12, 1 + i%28),
+            odbNames=('/scratch/bracket_v%d/Job-%d.odb'%(i%7, i%50), ),
+            keywords=(('var', variables[i%len(variables)]),
+                ('cut', 'Cut-%d'%(i%3)), ('text', 'peak at node %d'%i)))
+            for i in range(100000)]
+    for i, dateTime in enumerate(['', None, '23 March 2011',
+            '2011-03-23T17:33:3.0.5Z', '99999-03-23T17:33:30Z']):
+        headers[i].dateTime = dateTime    # missing or bad dates
+        assert dateToken(dateTime) is None, dateTime
+    start = time.time()
+    index = searchIndex(headers)
+    print "indexed %d views in %.2f s"%(len(headers), time.time() - start)
+    for query in ['var:S odb:bracket*', 'model4', 'cut:cut-2 var:peeq',
+            'text:"node 123"', 'date:2011-03']:
+        start = time.time()
+        found = index.search(query)
+        indexTime = time.time() - start
+        print "%-22s %6d views in %6.2f ms"%(query, len(found), 1e3*indexTime)
+    assert headers[0].id not in index.search('date:2011-01')   # date removed
@@ -0,0 +1,1061 @@
+"""Indexed storage of the userViews database used by viewSave.py
+
+The userViews xml file is streamed once to build a compact index of view
+headers. The full body of a view is parsed only when it is requested.
+Databases with an sqlite file extension are kept in SQLite instead.
+
+Only SQLite databases store the option blocks shared by many views
+(viewCodec.blockTags) once; the xml file keeps each view complete so it
+remains a plain userViews document.
+
+$Id$
+"""
+
+import os
+import sys
+import re
+import fnmatch
+import marshal
+import xml.parsers.expat
+from xml.dom import minidom
+from xml.sax.saxutils import quoteattr
+import viewCodec
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict  # Python < 2.7 loses the file order
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+prolog = ('<?xml version="1.0" ?>\n'
+    '<!DOCTYPE userViews [<!ATTLIST userView id ID #IMPLIED>]>\n'
+    '<!-- Saved settings for the View Manager Abaqus plugin -->\n')
+
+closingTag = re.compile(r'</userView\s*>')
+baseRecord = re.compile(r'<base size="(\d+)" mtime="([^"]+)"/>')
+journalSuffix = '.journal'
+indexSuffix = '.index'
+indexVersion = 2
+sqliteSuffixes = ('.db', '.sqlite', '.sqlite3')
+sqliteMagic = 'SQLite format 3\0'
+keywordTags = {'variableLabel': 'var', 'text': 'text'}  # leaf tag: field
+blockCacheEntries = 1000    # decoded option blocks kept by an sqliteStore
+literals = viewCodec.valueDecoder({})
+
+
+class formatError(Exception):
+    "The file is not in userViews format"
+
+
+def encode(value, chars="abcdefghijklmnopqrstuvwxyz"):  # {{{1
+    "Return the int value encoded into arbitrary base defined by chars."
+    if not value:
+        return chars[0]
+    base = len(chars)
+    converted = []
+    while(value):
+        value, remainder = divmod(value, base)
+        converted.append(chars[remainder])
+    converted.reverse()
+    return ''.join(converted)
+
+
+class idAllocator:  # {{{1
+    "Hand out unused encoded ids in amortized constant time"
+
+    def __init__(self, used=()):
+        self.used = set(used)
+        self.count = 0  # every id encoded below count is taken
+
+    def add(self, id):
+        "Mark id as used"
+        self.used.add(id)
+
+    def allocate(self):
+        "Return a new id which is not in use"
+        id = encode(self.count)
+        while id in self.used:
+            self.count += 1
+            id = encode(self.count)
+        self.count += 1
+        self.used.add(id)
+        return id
+
+
+class viewHeader(object):   # {{{1
+    "Compact summary of one userView and its location in the file"
+    __slots__ = ('id', 'name', 'dateTime', 'abaqusViewer', 'odbNames',
+            'annotation', 'offset', 'length', 'keywords')
+
+    def __init__(self, id, name='', dateTime='', abaqusViewer='', odbNames=(),
+            annotation=False, offset=None, length=0, keywords=()):
+        self.id = id
+        self.name = name
+        self.dateTime = dateTime
+        self.abaqusViewer = abaqusViewer
+        self.odbNames = odbNames
+        self.annotation = annotation
+        self.offset = offset    # byte offset of <userView in the file
+        self.length = length    # bytes up to (or including) </userView>
+        self.keywords = keywords    # (field, text) pairs for searching
+
+    def fields(self):
+        "Return tuple of values in constructor order, suitable for marshal"
+        return tuple([getattr(self, slot) for slot in self.__slots__])
+
+
+class streamIndexer:    # {{{1
+    "Build viewHeaders while streaming a userViews file through expat"
+
+    def __init__(self):
+        self.headers = []
+        self.depth = 0
+        self.current = None
+        self.keywordField = None    # field of the leaf text being collected
+        self.text = []
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+
+    def start(self, tag, attrs):
+        self.depth += 1
+        if 1 == self.depth:
+            if 'userViews' != tag:
+                raise formatError(str(tag))
+        elif 2 == self.depth:
+            if 'userView' == tag:
+                self.current = viewHeader(
+                        id=str(attrs.get('id', '')),
+                        name=str(attrs.get('name', '')),
+                        dateTime=str(attrs.get('dateTime', '')),
+                        abaqusViewer=str(attrs.get('abaqusViewer', '')),
+                        odbNames=[],
+                        offset=self.parser.CurrentByteIndex,
+                        keywords=[])
+        elif self.current:
+            if 'userData' == tag:
+                self.current.annotation = True
+            elif 'odbDisplay' == tag:
+                self.current.odbNames.append(str(attrs.get('name', '')))
+            elif 'ViewCut' == tag:
+                self.current.keywords.append(
+                        ('cut', str(attrs.get('name', ''))))
+            elif keywordTags.has_key(tag):
+                # Collect text only here so other elements stay fast
+                self.keywordField = keywordTags[tag]
+                self.text = []
+                self.parser.CharacterDataHandler = self.text.append
+
+    def end(self, tag):
+        if self.keywordField:
+            self.current.keywords.append( (self.keywordField,
+                keywordText(''.join(self.text).strip().encode('utf-8'))) )
+            self.keywordField = None
+            self.parser.CharacterDataHandler = None
+        if 2 == self.depth and self.current:
+            header = self.current
+            header.length = self.parser.CurrentByteIndex - header.offset
+            header.odbNames = tuple(header.odbNames)
+            header.keywords = tuple(header.keywords)
+            self.headers.append(header)
+            self.current = None
+        self.depth -= 1
+
+    def parse(self, f):
+        "Return list of viewHeaders found in open file f"
+        self.parser.ParseFile(f)
+        return self.headers
+
+
+def keywordText(text):  # {{{1
+    "Return the string saved as repr() text, or the text itself"
+    try:
+        value = literals.decode(text)
+    except ValueError:
+        return text
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, str):
+        return value
+    return text
+
+
+def matches(pattern, value):   # {{{1
+    "Case insensitive shell-style match; None matches everything"
+    return pattern is None or fnmatch.fnmatch(value.lower(), pattern.lower())
+
+
+def likePattern(pattern):   # {{{1
+    "Convert shell-style pattern to an SQL LIKE pattern with escape '\\'"
+    like = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return like.replace('*', '%').replace('?', '_')
+
+
+def elementKeywords(xmlView):   # {{{1
+    "Return tuple of (field, text) search keywords of the userView element"
+    keywords = [('cut', str(viewCut.getAttribute('name')))
+            for viewCut in xmlView.getElementsByTagName('ViewCut')]
+    for tag, field in keywordTags.items():
+        for leaf in xmlView.getElementsByTagName(tag):
+            text = ''.join([child.data for child in leaf.childNodes
+                if child.nodeType == child.TEXT_NODE])
+            keywords.append( (field, keywordText(text.strip().encode('utf-8'))) )
+    return tuple(keywords)
+
+
+def headerFromElement(xmlView):   # {{{1
+    "Return a viewHeader summarizing the userView xml element"
+    return viewHeader(
+            id=str(xmlView.getAttribute('id')),
+            name=str(xmlView.getAttribute('name')),
+            dateTime=str(xmlView.getAttribute('dateTime')),
+            abaqusViewer=str(xmlView.getAttribute('abaqusViewer')),
+            odbNames=tuple([str(od.getAttribute('name'))
+                for od in xmlView.getElementsByTagName('odbDisplay')]),
+            annotation=bool(xmlView.getElementsByTagName('userData')),
+            keywords=elementKeywords(xmlView))
+
+
+def fileStamp(stat):    # {{{1
+    "Return (size, mtime) identifying the version of a file from its stat"
+    return stat.st_size, stat.st_mtime
+
+
+def journalBase(line):  # {{{1
+    "Return the database fileStamp in the first line of a journal or None"
+    m = baseRecord.match(line)
+    if m:
+        return int(m.group(1)), float(m.group(2))
+    return None
+
+
+class xmlStore:     # {{{1
+    """userViews database kept in an xml file and indexed by view id
+
+    When journalLimit is nonzero new views, renames and deletions are
+    appended as small records to a journal file next to the database.
+    The database is compacted once the journal grows beyond journalLimit
+    bytes or when compact() is called.
+
+    The headers are cached in a sidecar index file so that reopening an
+    unchanged database does not parse any xml.
+
+    Several sessions may share the file, so its size and time stamp are
+    checked before the stored offsets are used. If another session has
+    replaced it the headers are read again and the changes this session
+    has not written yet are applied on top. The journal starts with the
+    stamp of the database it belongs to and the records other sessions
+    append are replayed before this session appends or compacts.
+    """
+
+    def __init__(self, fileName, journalLimit=0):
+        self.fileName = fileName
+        self.journalLimit = journalLimit
+        self.headers = OrderedDict()    # view id: viewHeader
+        self.ids = idAllocator()
+        self.modified = {}  # view id: xml element which must be written
+        self.journal = []   # (record tag, view id) not yet in the journal file
+        self.changed = False
+        self.compactNeeded = False
+        self.stamp = None   # fileStamp of the file the offsets refer to
+        self.generation = 0     # counts re-indexing after outside changes
+        self.journalOffset = 0  # bytes of the journal file replayed
+        if not os.path.exists(fileName):
+            self.changed = True     # Create the file on first write
+            self.compactNeeded = True
+            return
+        self.index()
+
+    def index(self):
+        "Read the view headers of the database file and replay the journal"
+        f = open(self.fileName, 'rb')
+        try:
+            self.stamp = fileStamp(os.fstat(f.fileno()))
+            headers = self.readIndex()
+            if headers is None:
+                headers = streamIndexer().parse(f)
+        finally:
+            f.close()
+        self.headers = OrderedDict()
+        self.modified = {}
+        self.compactNeeded = False
+        self.ids = idAllocator([header.id for header in headers])
+        for header in headers:
+            if not header.id or self.headers.has_key(header.id):
+                header.id = self.ids.allocate()
+                self.modified[header.id] = None     # store id on next write
+                self.compactNeeded = True   # journal requires stable ids
+            self.headers[header.id] = header
+        if not self.compactNeeded:
+            self.writeIndex()
+        self.journalOffset = 0
+        self.replayJournal()
+
+    def refresh(self):
+        "Index the database again if another session has replaced it"
+        try:
+            stamp = fileStamp(os.stat(self.fileName))
+        except OSError:
+            return  # not written yet
+        if stamp != self.stamp:
+            self.reload()
+        elif self.replayJournal():
+            self.generation += 1
+
+    def reload(self):
+        "Index the changed database and apply the changes not yet written"
+        pending = self.journal
+        headers = self.headers
+        modified = self.modified
+        changed = self.changed
+        self.journal = []
+        self.index()
+        newIds = {}     # pending view id: id after another session took it
+        for tag, viewId in pending:
+            viewId = newIds.get(viewId, viewId)
+            if 'userView' == tag and modified.get(viewId) is not None:
+                newIds[viewId] = self.addView(modified[viewId]).id
+            elif 'rename' == tag and headers.has_key(viewId):
+                self.renameView(viewId, headers[viewId].name)
+            elif 'delete' == tag:
+                self.deleteView(viewId)
+        self.changed = changed or bool(self.journal)
+        self.generation += 1
+
+    def openBase(self):
+        "Return the database file opened at the version the offsets refer to"
+        for attempt in range(10):
+            self.refresh()
+            f = open(self.fileName, 'rb')
+            if fileStamp(os.fstat(f.fileno())) == self.stamp:
+                return f
+            f.close()   # replaced between the check and the open
+        raise IOError('%s is changing too often to be read'%self.fileName)
+
+    def readIndex(self):
+        "Return headers from the sidecar index or None if it is out of date"
+        try:
+            f = open(self.fileName + indexSuffix, 'rb')
+            try:
+                version, size, mtime, rows = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if indexVersion != version or (size, mtime) != self.stamp:
+            return None
+        return [viewHeader(*row) for row in rows]
+
+    def writeIndex(self):
+        "Save the headers of the database file to the sidecar index"
+        size, mtime = self.stamp
+        rows = [header.fields() for header in self.headers.values()]
+        try:
+            f = open(self.fileName + indexSuffix, 'wb')
+            try:
+                marshal.dump((indexVersion, size, mtime, rows), f)
+            finally:
+                f.close()
+        except IOError:
+            pass    # index is optional, e.g. in a read-only directory
+
+    def replayJournal(self):
+        "Apply the journal records added since the last replay; return count"
+        journalName = self.fileName + journalSuffix
+        try:
+            size = os.path.getsize(journalName)
+        except OSError:
+            self.journalOffset = 0
+            return 0
+        if size == self.journalOffset:
+            return 0
+        if size < self.journalOffset:
+            self.journalOffset = 0  # replaced by another session
+        count = 0
+        f = open(journalName, 'rb')
+        try:
+            if not self.journalOffset:
+                base = journalBase(f.readline())
+                if base is None:
+                    f.seek(0)   # journal written before base records
+                elif base != self.stamp:
+                    return 0    # left by a compaction which included it
+                self.journalOffset = f.tell()
+            f.seek(self.journalOffset)
+            while True:
+                line = f.readline()
+                if not line.endswith('\n'):
+                    break   # end of file or a record still being written
+                try:
+                    record = minidom.parseString(line).documentElement
+                except xml.parsers.expat.ExpatError:
+                    break   # incomplete record from an interrupted write
+                self.applyRecord(record)
+                self.journalOffset = f.tell()
+                count += 1
+        finally:
+            f.close()
+        return count
+
+    def applyRecord(self, record):
+        "Apply one journal record element to the headers"
+        viewId = str(record.getAttribute('id'))
+        if 'userView' == record.tagName:
+            if self.headers.has_key(viewId) and \
+                    ('userView', viewId) in self.journal:
+                self.renumber(viewId)   # another session used the same id
+            if not self.headers.has_key(viewId):
+                self.ids.add(viewId)
+                self.headers[viewId] = headerFromElement(record)
+                self.modified[viewId] = record
+        elif 'rename' == record.tagName:
+            if self.headers.has_key(viewId):
+                self.headers[viewId].name = str(record.getAttribute('name'))
+                self.modified.setdefault(viewId, None)
+        elif 'delete' == record.tagName:
+            self.headers.pop(viewId, None)
+            self.modified.pop(viewId, None)
+
+    def renumber(self, viewId):
+        "Give the new view viewId, which is not written yet, an unused id"
+        newId = self.ids.allocate()
+        header = self.headers.pop(viewId)
+        header.id = newId
+        self.headers[newId] = header
+        xmlView = self.modified.pop(viewId)
+        xmlView.setAttribute('id', newId)
+        self.modified[newId] = xmlView
+        self.journal = [(tag, id == viewId and newId or id)
+                for tag, id in self.journal]
+
+    def journalTail(self):
+        "Return the complete journal records which have not been replayed"
+        if not self.journalOffset:
+            return ''
+        try:
+            f = open(self.fileName + journalSuffix, 'rb')
+        except IOError:
+            return ''
+        try:
+            f.seek(self.journalOffset)
+            tail = f.read()
+        finally:
+            f.close()
+        return tail[:tail.rfind('\n') + 1]
+
+    def journalRecord(self, tag, viewId):
+        "Return the journal text of a pending change or None if obsolete"
+        if 'userView' == tag:
+            xmlView = self.modified.get(viewId)
+            if xmlView is not None:
+                return xmlView.toxml('utf-8')
+        elif 'rename' == tag:
+            header = self.headers.get(viewId)
+            if header:
+                return '<rename id=%s name=%s/>'%(
+                    quoteattr(viewId), quoteattr(header.name))
+        elif 'delete' == tag:
+            return '<delete id=%s/>'%quoteattr(viewId)
+        return None
+
+    def readRaw(self, header, f):
+        """Return the raw xml text of the view identified by header
+
+        f must come from openBase so that the offset is valid.
+        """
+        f.seek(header.offset)
+        raw = f.read(header.length + 64)
+        if not raw.startswith('<userView'):
+            raise formatError('%s: no view at offset %d'%(
+                self.fileName, header.offset))
+        m = closingTag.match(raw, header.length)
+        if m:
+            return raw[:m.end()]
+        return raw[:header.length]
+
+    def getView(self, viewId):
+        "Return the userView xml element, parsing it only if necessary"
+        f = None
+        if self.modified.get(viewId) is None and self.headers.has_key(viewId):
+            f = self.openBase()     # may read changes of other sessions
+        try:
+            header = self.headers.get(viewId)
+            if not header:
+                return None
+            return self.viewElement(header, f)
+        finally:
+            if f:
+                f.close()
+
+    def viewElement(self, header, f):
+        "Return the userView element of header with its current id and name"
+        xmlView = self.modified.get(header.id)
+        if xmlView is None:
+            xmlView = minidom.parseString(
+                    self.readRaw(header, f)).documentElement
+        for attr in 'id', 'name':
+            value = getattr(header, attr)
+            if xmlView.getAttribute(attr) != value:
+                xmlView.setAttribute(attr, value)
+        return xmlView
+
+    def getNode(self, viewId):
+        "Return the userView as a viewCodec node or None"
+        xmlView = self.getView(viewId)
+        if not xmlView:
+            return None
+        return viewCodec.fromXml(xmlView)
+
+    def readNodes(self, viewIds):
+        """Return a generator function of (view id, node) for viewIds
+
+        The view locations are copied now so the generator may run on
+        another thread. Views changed since the last write are left out,
+        as is everything if another session replaces the file meanwhile.
+        """
+        self.refresh()
+        headers = [viewHeader(header.id, header.name, offset=header.offset,
+                length=header.length)
+            for header in [self.headers.get(viewId) for viewId in viewIds]
+            if header and not self.modified.has_key(header.id)]
+        fileName = self.fileName
+        stamp = self.stamp
+        readRaw = self.readRaw
+
+        def read():
+            try:
+                f = open(fileName, 'rb')
+                try:
+                    if fileStamp(os.fstat(f.fileno())) != stamp:
+                        return
+                    # Close the file quickly; write() may replace it
+                    raws = [(header, readRaw(header, f)) for header in headers]
+                finally:
+                    f.close()
+            except (IOError, formatError):
+                return
+            for header, raw in raws:
+                try:
+                    node = viewCodec.fromXml(
+                            minidom.parseString(raw).documentElement)
+                except xml.parsers.expat.ExpatError:
+                    continue
+                node[viewCodec.ATTRIBUTES].update(id=header.id,
+                        name=header.name)
+                yield header.id, node
+        return read
+
+    def addView(self, xmlView):
+        "Add the userView xml element and return its new viewHeader"
+        viewId = str(xmlView.getAttribute('id'))
+        if not viewId or viewId in self.ids.used:
+            viewId = self.ids.allocate()
+            xmlView.setAttribute('id', viewId)
+        else:
+            self.ids.add(viewId)
+        header = headerFromElement(xmlView)
+        self.headers[viewId] = header
+        self.modified[viewId] = xmlView
+        self.journal.append( ('userView', viewId) )
+        self.changed = True
+        return header
+
+    def renameView(self, viewId, name):
+        "Change the name of the view; return False if it does not exist"
+        header = self.headers.get(viewId)
+        if not header:
+            return False
+        header.name = str(name)
+        self.modified.setdefault(viewId, None)  # getView applies the name
+        self.journal.append( ('rename', viewId) )
+        self.changed = True
+        return True
+
+    def findViews(self, name=None, odbName=None, abaqusViewer=None):
+        "Return ids of views matching all of the given shell-style patterns"
+        return [header.id for header in self.headers.values()
+                if matches(name, header.name)
+                and matches(abaqusViewer, header.abaqusViewer)
+                and (odbName is None or
+                    [odb for odb in header.odbNames if matches(odbName, odb)])]
+
+    def deleteView(self, viewId):
+        "Remove the view; return False if it does not exist"
+        if not self.headers.has_key(viewId):
+            return False
+        del self.headers[viewId]
+        self.modified.pop(viewId, None)
+        self.journal.append( ('delete', viewId) )
+        self.changed = True
+        return True
+
+    def write(self, fileName=None):
+        "Append pending changes to the journal or compact into fileName"
+        if not self.changed:
+            return
+        if self.journalLimit and not self.compactNeeded and \
+                (not fileName or fileName == self.fileName):
+            self.refresh()  # apply the records of other sessions first
+            journalName = self.fileName + journalSuffix
+            f = open(journalName, 'ab')
+            try:
+                if not self.journalOffset:
+                    # Missing or left over from an older database
+                    f.truncate(0)
+                    f.write('<base size="%d" mtime="%r"/>\n'%self.stamp)
+                for tag, viewId in self.journal:
+                    record = self.journalRecord(tag, viewId)
+                    if record:
+                        # One record per line
+                        f.write(record.replace('\r', '&#13;')
+                                .replace('\n', '&#10;'))
+                        f.write('\n')
+                self.journalOffset = f.tell()
+            finally:
+                f.close()
+            self.journal = []
+            self.changed = False
+            if os.path.getsize(journalName) < self.journalLimit:
+                return
+        self.compact(fileName)
+
+    def compact(self, fileName=None):
+        "Save to fileName, copying unmodified views directly from the old file"
+        if not fileName:
+            fileName = self.fileName
+        bkupName = fileName + '~'
+        old = None
+        if os.path.exists(self.fileName):
+            old = self.openBase()   # offsets are checked, never stale
+        out = open(bkupName, 'wb')
+        locations = []
+        try:
+            out.write(prolog)
+            out.write('<userViews>')
+            for viewId, header in self.headers.items():
+                if self.modified.has_key(viewId):
+                    raw = self.viewElement(header, old).toxml('utf-8')
+                else:
+                    raw = self.readRaw(header, old)
+                locations.append( (header, out.tell(), len(raw)) )
+                out.write(raw)
+            out.write('</userViews>\n')
+        finally:
+            out.close()
+            if old:
+                old.close()
+        journalName = self.fileName + journalSuffix
+        tail = ''
+        if fileName == self.fileName:
+            tail = self.journalTail()   # appended since the last replay
+        if os.path.exists(fileName):
+            os.remove(fileName)
+        os.rename(bkupName, fileName)
+        self.stamp = fileStamp(os.stat(fileName))
+        self.journalOffset = 0
+        if fileName == self.fileName and os.path.exists(journalName):
+            if tail:
+                # Keep the records this session has not seen for the new file
+                base = '<base size="%d" mtime="%r"/>\n'%self.stamp
+                f = open(journalName, 'wb')
+                try:
+                    f.write(base + tail)
+                finally:
+                    f.close()
+                self.journalOffset = len(base)
+            else:
+                os.remove(journalName)  # changes are now in the database
+        for header, offset, length in locations:
+            header.offset = offset
+            header.length = length
+        self.fileName = fileName
+        self.modified.clear()
+        self.journal = []
+        self.changed = False
+        self.compactNeeded = False
+        self.writeIndex()
+
+
+def loadBlock(db, blocks, digest):  # {{{1
+    """Return the shared option block node, decoding it only once
+
+    blocks keeps at most blockCacheEntries decoded nodes, oldest first.
+    """
+    node = blocks.get(digest)
+    if node is None:
+        row = db.execute('SELECT body FROM block WHERE digest = ?',
+                (digest, )).fetchone()
+        if not row:
+            return None
+        node = blocks[digest] = viewCodec.unpack(str(row[0]))
+        while len(blocks) > blockCacheEntries:
+            if OrderedDict is dict:
+                blocks.popitem()
+            else:
+                blocks.popitem(last=False)
+    return node
+
+
+def blockReferences(node):  # {{{1
+    "Return set of the block digests referenced by a viewCodec node"
+    return set([block[viewCodec.ATTRIBUTES][viewCodec.blockKey]
+        for tag in viewCodec.blockTags
+        for block in viewCodec.findAll(node, tag)
+        if block[viewCodec.ATTRIBUTES].has_key(viewCodec.blockKey)])
+
+
+def rowNode(row, getBlock):     # {{{1
+    "Return the viewCodec node of a (name, body) userView row"
+    name, body = row
+    body = str(body)
+    if body.startswith('<'):
+        node = viewCodec.fromXml(minidom.parseString(body).documentElement)
+    else:
+        node = viewCodec.joinBlocks(viewCodec.unpack(body), getBlock)
+    node[viewCodec.ATTRIBUTES]['name'] = name
+    return node
+
+
+class sqliteStore:  # {{{1
+    """userViews database kept in an SQLite file
+
+    Several Abaqus sessions may share the file; SQLite serializes their
+    writes and each change is committed immediately. The headers are read
+    again, and generation incremented, when another session has committed. Option blocks are
+    stored once and counted in viewBlock; a block is deleted with the
+    last view which refers to it.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS userView (
+            id TEXT PRIMARY KEY,
+            name TEXT COLLATE NOCASE,
+            dateTime TEXT,
+            abaqusViewer TEXT COLLATE NOCASE,
+            annotation INTEGER,
+            body BLOB);         -- viewCodec.pack with block references or xml
+        CREATE TABLE IF NOT EXISTS odbDisplay (
+            viewId TEXT REFERENCES userView(id) ON DELETE CASCADE,
+            odbName TEXT COLLATE NOCASE);
+        CREATE TABLE IF NOT EXISTS block (   -- shared viewCodec.blockTags
+            digest TEXT PRIMARY KEY,
+            body BLOB);
+        CREATE TABLE IF NOT EXISTS viewBlock (   -- block references
+            viewId TEXT REFERENCES userView(id) ON DELETE CASCADE,
+            digest TEXT);
+        CREATE TABLE IF NOT EXISTS keyword (  -- viewStore.viewHeader.keywords
+            viewId TEXT REFERENCES userView(id) ON DELETE CASCADE,
+            field TEXT,
+            value TEXT);
+        CREATE INDEX IF NOT EXISTS userViewName ON userView(name);
+        CREATE INDEX IF NOT EXISTS userViewDateTime ON userView(dateTime);
+        CREATE INDEX IF NOT EXISTS userViewVersion ON userView(abaqusViewer);
+        CREATE INDEX IF NOT EXISTS odbDisplayView ON odbDisplay(viewId);
+        CREATE INDEX IF NOT EXISTS odbDisplayName ON odbDisplay(odbName);
+        CREATE INDEX IF NOT EXISTS keywordView ON keyword(viewId);
+        CREATE INDEX IF NOT EXISTS viewBlockView ON viewBlock(viewId);
+        CREATE INDEX IF NOT EXISTS viewBlockDigest ON viewBlock(digest);
+        """
+    version = 1     # PRAGMA user_version; 1 added viewBlock
+
+    # Blocks of a view which no other view refers to
+    orphanBlocks = """DELETE FROM block WHERE digest IN
+        (SELECT digest FROM viewBlock WHERE viewId = ?) AND NOT EXISTS
+        (SELECT 1 FROM viewBlock WHERE viewBlock.digest = block.digest
+            AND viewBlock.viewId != ?)"""
+
+    def __init__(self, fileName, timeout=30):
+        if not sqlite3:
+            raise formatError('sqlite3 is not available')
+        self.fileName = fileName
+        self.headers = OrderedDict()    # view id: viewHeader
+        try:
+            self.db = sqlite3.connect(fileName, timeout=timeout,
+                    isolation_level=None)   # explicit transactions below
+            self.db.text_factory = str
+            self.db.execute('PRAGMA foreign_keys = ON')
+            self.db.executescript(self.schema)
+            if self.db.execute('PRAGMA user_version').fetchone()[0] < \
+                    self.version:
+                self.countBlocks()
+        except sqlite3.DatabaseError:
+            raise formatError(str(sys.exc_info()[1]))
+        self.blocks = OrderedDict()     # digest: decoded block node, bounded
+        self.generation = 0     # counts re-reading after outside changes
+        self.loadHeaders()
+
+    def loadHeaders(self):
+        "Read the headers of all views"
+        self.db.execute('BEGIN')    # one snapshot of the tables
+        try:
+            self.dataVersion = self.db.execute('PRAGMA data_version').fetchone()
+            self.headers = OrderedDict()
+            for row in self.db.execute('SELECT id, name, dateTime, '
+                    'abaqusViewer, annotation FROM userView ORDER BY rowid'):
+                header = viewHeader(row[0], row[1], row[2], row[3],
+                        annotation=bool(row[4]))
+                header.odbNames = []
+                header.keywords = []
+                self.headers[header.id] = header
+            for viewId, odbName in self.db.execute(
+                    'SELECT viewId, odbName FROM odbDisplay ORDER BY rowid'):
+                self.headers[viewId].odbNames.append(odbName)
+            for row in self.db.execute(
+                    'SELECT viewId, field, value FROM keyword ORDER BY rowid'):
+                self.headers[row[0]].keywords.append(row[1:])
+            for header in self.headers.values():
+                header.odbNames = tuple(header.odbNames)
+                header.keywords = tuple(header.keywords)
+            self.ids = idAllocator(self.headers.keys())
+        finally:
+            self.db.execute('COMMIT')
+
+    def refresh(self):
+        "Read the headers again if another session has committed changes"
+        if self.db.execute('PRAGMA data_version').fetchone() != \
+                self.dataVersion:
+            self.loadHeaders()
+            self.generation += 1
+
+    def countBlocks(self):
+        "Fill viewBlock from the views of a database made before it existed"
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            if self.db.execute('PRAGMA user_version').fetchone()[0] < \
+                    self.version:   # not done by another session meanwhile
+                self.db.execute('DELETE FROM viewBlock')
+                for viewId, body in self.db.execute(
+                        'SELECT id, body FROM userView').fetchall():
+                    body = str(body)
+                    if body.startswith('<'):
+                        continue    # stored whole
+                    self.db.executemany('INSERT INTO viewBlock VALUES (?, ?)',
+                        [(viewId, digest) for digest in
+                            blockReferences(viewCodec.unpack(body))])
+                self.db.execute('PRAGMA user_version = %d'%self.version)
+        except:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def transaction(self, *statements):
+        "Execute (sql, parameters) statements atomically"
+        self.db.execute('BEGIN IMMEDIATE')  # lock out other writers
+        try:
+            for sql, parameters in statements:
+                self.db.execute(sql, parameters)
+        except:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def getNode(self, viewId):
+        "Return the userView as a viewCodec node using the primary key index"
+        self.refresh()
+        row = self.db.execute('SELECT name, body FROM userView WHERE id = ?',
+                (viewId, )).fetchone()
+        if not row:
+            return None
+        return rowNode(row, self.getBlock)
+
+    def getBlock(self, digest):
+        "Return the shared option block node, decoding it only once"
+        return loadBlock(self.db, self.blocks, digest)
+
+    def readNodes(self, viewIds):
+        """Return a generator function of (view id, node) for viewIds
+
+        The generator uses its own connection so it may run on another
+        thread; SQLite connections cannot be shared between threads.
+        """
+        self.refresh()
+        viewIds = list(viewIds)
+        fileName = self.fileName
+        blocks = OrderedDict(self.blocks)   # decoded blocks are never modified
+
+        def read():
+            try:
+                db = sqlite3.connect(fileName)
+                try:
+                    db.text_factory = str
+                    getBlock = lambda digest: loadBlock(db, blocks, digest)
+                    for viewId in viewIds:
+                        row = db.execute('SELECT name, body FROM userView '
+                                'WHERE id = ?', (viewId, )).fetchone()
+                        if row:
+                            yield viewId, rowNode(row, getBlock)
+                finally:
+                    db.close()
+            except sqlite3.Error:
+                return
+        return read
+
+    def getView(self, viewId):
+        "Return the userView xml element or None"
+        node = self.getNode(viewId)
+        if not node:
+            return None
+        return viewCodec.toXml(node, minidom.Document())
+
+    def addView(self, xmlView):
+        "Add the userView xml element and return its new viewHeader"
+        viewId = str(xmlView.getAttribute('id'))
+        while True:
+            if not viewId or viewId in self.ids.used:
+                viewId = self.ids.allocate()
+                xmlView.setAttribute('id', viewId)
+            else:
+                self.ids.add(viewId)
+            header = headerFromElement(xmlView)
+            blocks = {}
+            node = viewCodec.splitBlocks(viewCodec.fromXml(xmlView), blocks)
+            statements = [('INSERT OR IGNORE INTO block VALUES (?, ?)',
+                (digest, sqlite3.Binary(viewCodec.pack(block))))
+                for digest, block in blocks.items()]
+            statements.append(('INSERT INTO userView VALUES (?, ?, ?, ?, ?, ?)',
+                (header.id, header.name, header.dateTime, header.abaqusViewer,
+                    header.annotation,
+                    sqlite3.Binary(viewCodec.pack(node)))))
+            statements.extend([
+                ('INSERT INTO odbDisplay VALUES (?, ?)', (header.id, odbName))
+                for odbName in header.odbNames])
+            statements.extend([
+                ('INSERT INTO keyword VALUES (?, ?, ?)', (header.id, ) + keyword)
+                for keyword in header.keywords])
+            statements.extend([
+                ('INSERT INTO viewBlock VALUES (?, ?)', (header.id, digest))
+                for digest in blocks.keys()])
+            try:
+                self.transaction(*statements)
+                break
+            except sqlite3.IntegrityError:
+                viewId = None   # id was taken by another session
+        self.headers[viewId] = header
+        return header
+
+    def renameView(self, viewId, name):
+        "Change the name of the view; return False if it does not exist"
+        if not self.headers.has_key(viewId):
+            return False
+        self.headers[viewId].name = str(name)
+        self.transaction(('UPDATE userView SET name = ? WHERE id = ?',
+            (str(name), viewId)))
+        return True
+
+    def findViews(self, name=None, odbName=None, abaqusViewer=None):
+        "Return ids of views matching all of the given shell-style patterns"
+        sql = 'SELECT id FROM userView'
+        where = []
+        parameters = []
+        if name is not None:
+            where.append("name LIKE ? ESCAPE '\\'")
+            parameters.append(likePattern(name))
+        if abaqusViewer is not None:
+            where.append("abaqusViewer LIKE ? ESCAPE '\\'")
+            parameters.append(likePattern(abaqusViewer))
+        if odbName is not None:
+            where.append("id IN (SELECT viewId FROM odbDisplay "
+                    "WHERE odbName LIKE ? ESCAPE '\\')")
+            parameters.append(likePattern(odbName))
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return [row[0] for row in
+                self.db.execute(sql + ' ORDER BY rowid', parameters)]
+
+    def deleteView(self, viewId):
+        "Remove the view; return False if it does not exist"
+        if not self.headers.has_key(viewId):
+            return False
+        del self.headers[viewId]
+        self.transaction((self.orphanBlocks, (viewId, viewId)),
+                ('DELETE FROM userView WHERE id = ?', (viewId, )))
+        return True
+
+    def write(self, fileName=None):
+        "Changes are committed immediately; export if fileName is different"
+        self.refresh()
+        if fileName and fileName != self.fileName:
+            copyViews(self, openStore(fileName)).write()
+
+    def compact(self, fileName=None):
+        "Reclaim space left by deleted views and unreferenced blocks"
+        self.write(fileName)
+        self.transaction(('DELETE FROM block WHERE NOT EXISTS (SELECT 1 '
+            'FROM viewBlock WHERE viewBlock.digest = block.digest)', ()))
+        self.blocks.clear()
+        self.db.execute('VACUUM')
+
+
+def openStore(fileName, journalLimit=0):    # {{{1
+    "Return the xmlStore or sqliteStore appropriate for fileName"
+    isSqlite = os.path.splitext(fileName)[1].lower() in sqliteSuffixes
+    if os.path.exists(fileName) and os.path.getsize(fileName):
+        f = open(fileName, 'rb')
+        try:
+            isSqlite = f.read(len(sqliteMagic)) == sqliteMagic
+        finally:
+            f.close()
+    if isSqlite:
+        return sqliteStore(fileName)
+    return xmlStore(fileName, journalLimit)
+
+
+def blockStats(store):     # {{{1
+    """Return counts describing how much the option blocks are shared
+
+    (views, block references, distinct blocks, bytes, distinct bytes)
+    where bytes are the size of the blocks in viewCodec JSON form.
+    """
+    sizes = {}  # digest: bytes
+    references = size = 0
+    for viewId in store.headers.keys():
+        view = store.getNode(viewId)
+        for tag in viewCodec.blockTags:
+            for block in viewCodec.findAll(view, tag):
+                digest = viewCodec.blockDigest(block)
+                sizes[digest] = len(viewCodec.dumps(block))
+                references += 1
+                size += sizes[digest]
+    return len(store.headers), references, len(sizes), size, \
+            sum(sizes.values())
+
+
+def copyViews(source, destination):     # {{{1
+    "Import all views of the source store into destination; return destination"
+    for viewId in source.headers.keys():
+        destination.addView(source.getView(viewId))
+    return destination
+
+
+if __name__ == '__main__':  # {{{1 Report option block sharing or benchmark
+    import time
+    import tempfile
+    if len(sys.argv) > 1:
+        for fileName in sys.argv[1:]:
+            views, references, distinct, size, distinctSize = \
+                    blockStats(openStore(fileName))
+            print "%s: %d views, %d option blocks, %d distinct " \
+                    "(%.1fx fewer, %d of %d bytes)"%(fileName, views,
+                    references, distinct,
+                    float(references)/max(distinct, 1), distinctSize, size)
+        sys.exit()
+    view = ('<userView name="view%d" dateTime="2011-03-23T17:33:30Z">'
+        '<Viewport name="Viewport: 1"><odbDisplay name="job.odb">'
+        '<commonOptions><renderStyle>FILLED</renderStyle></commonOptions>'
+        '</odbDisplay></Viewport></userView>')
+    for count in 10000, 100000:
+        fd, fileName = tempfile.mkstemp(suffix='.xml')
+        f = os.fdopen(fd, 'wb')
+        f.write(prolog + '<userViews>')
+        for i in range(count):
+            f.write(view%i)
+        f.write('</userViews>')
+        f.close()
+        start = time.time()
+        store = xmlStore(fileName)
+        elapsed = time.time() - start
+        assert len(store.headers) == count
+        print "%6d views without ids loaded in %.3f s"%(count, elapsed)
+        os.remove(fileName)
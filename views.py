@@ -7,36 +7,73 @@ $Id$
 from abaqus import session
 from abaqusConstants import *
 
-try:
-    import numpy as np
-except ImportError:
-    # Abaqus versions < 6.10-ef use the older Numeric module.
-    import Numeric as np
-
-    def cross(a, b):
-        " Vector cross product as in Matlab "
-        return np.array([ a[1]*b[2] - a[2]*b[1],
-                          a[2]*b[0] - a[0]*b[2],
-                          a[0]*b[1] - a[1]*b[0] ])
-    np.cross = cross
-
-def norm(v):
-    " Vector length as in Matlab "
-    return np.sqrt(np.sum(v*v, axis=-1))
-
-def rotateVector(point, vector, th):
-    """Calculate rotation of "point" around arbitrary "vector" by radian angle "th".
-
-    http://www.mines.edu/~gmurray/ArbitraryAxisRotation/ArbitraryAxisRotation.html
+import cameraMath
+from cameraMath import np, norm, rotateVector
+
+suspendedViewports = {}    # viewport name: nesting depth of deferredRedraw
+changedViewports = set()    # suspended viewport names with counted changes
+redrawCount = 0     # number of refreshes forced by deferredRedraw
+suppressedRedraws = 0   # changes made while refresh was disabled
+printingFrames = False  # True while printed images should not be saved as views
+
+
+class deferredRedraw:
+    """Suspend refresh of viewports while several changes are applied
+
+    The viewports are redrawn once when the with block exits:
+        with deferredRedraw(viewports):
+            ...
+    Each change made inside the block would have redrawn on its own; code
+    which applies changes reports them with countChange so suppressedRedraws
+    can be compared with redrawCount.  If counted is True all changes in the
+    block are reported and viewports without a counted change are not redrawn.
+    """
+    def __init__(self, viewports=None, counted=False):
+        if viewports is None:
+            viewports = session.viewports.values()
+        self.names = [vp.name for vp in viewports]
+        self.counted = counted
+
+    def __enter__(self):
+        for name in self.names:
+            depth = suspendedViewports.get(name, 0)
+            if not depth:
+                session.viewports[name].disableRefresh()
+            suspendedViewports[name] = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global redrawCount
+        if not self.counted:
+            changedViewports.update(self.names)     # assume all were changed
+        for name in self.names:
+            depth = suspendedViewports.pop(name, 1) - 1
+            if depth:
+                suspendedViewports[name] = depth    # still nested
+                continue
+            changed = name in changedViewports
+            changedViewports.discard(name)
+            if session.viewports.has_key(name):
+                viewport = session.viewports[name]
+                viewport.enableRefresh()
+                if changed:
+                    viewport.forceRefresh()
+                    redrawCount += 1
+        return False    # do not suppress exceptions
+
+def countChange(count=1, viewports=None):
+    """Record changes which would have redrawn if refresh was enabled
+
+    The changes are to viewports, by default all suspended viewports.
     """
-    x, y, z = point
-    u, v, w = vector
-    a = np.array([ [x*(v*v + w*w) - u*(v*y + w*z), -w*y + v*z],
-                   [y*(u*u + w*w) - v*(u*x + w*z),  w*x - u*z],
-                   [z*(u*u + v*v) - w*(u*x + v*y), -v*x + u*y] ])
-    a = point*np.sum(point*vector) + \
-            np.dot(a, [np.cos(th), norm(vector)*np.sin(th)])
-    return a/np.sum(vector*vector)
+    global suppressedRedraws
+    if suspendedViewports:
+        suppressedRedraws += count
+        if viewports is None:
+            changedViewports.update(suspendedViewports)
+        else:
+            changedViewports.update(vp.name for vp in viewports
+                    if suspendedViewports.has_key(vp.name))
 
 def getViewportDisplay(viewport=None):
     """Return current viewport and display"""
@@ -71,100 +108,228 @@ def modelPan(vector, viewport=None):
 def cutViewNormal(viewport=None, cutName="Viewnormal"):
     """Create a cut normal to the current view."""
     viewport, display = getViewportDisplay()
-    viewVector = np.array(viewport.view.viewVector)
-    if display.viewCuts.has_key(cutName):
-        viewCut = display.viewCuts[cutName]
-        viewCut.setValues(
-            normal=-viewVector,
-            axis2=np.cross(-viewVector,
-                viewport.view.cameraUpVector))
-    else:
-        viewCut = display.ViewCut(
-            name=cutName,
-            shape=PLANE,
-            origin=viewport.view.cameraTarget,
-            normal=-viewVector,
-            axis2=np.cross(-viewVector,
-                viewport.view.cameraUpVector))
-    viewCut.setValues(motion=TRANSLATE, position=0)
-    display.setValues(viewCutNames=(cutName,), viewCut=ON)
+    with deferredRedraw([viewport]):
+        viewVector = np.array(viewport.view.viewVector)
+        if display.viewCuts.has_key(cutName):
+            viewCut = display.viewCuts[cutName]
+            viewCut.setValues(
+                normal=-viewVector,
+                axis2=np.cross(-viewVector,
+                    viewport.view.cameraUpVector))
+        else:
+            viewCut = display.ViewCut(
+                name=cutName,
+                shape=PLANE,
+                origin=viewport.view.cameraTarget,
+                normal=-viewVector,
+                axis2=np.cross(-viewVector,
+                    viewport.view.cameraUpVector))
+        viewCut.setValues(motion=TRANSLATE, position=0)
+        display.setValues(viewCutNames=(cutName,), viewCut=ON)
 
-def synchVps(basevp=None):
-    """ Synchronize all other viewports to the given or current viewport """
-    # Updated Aug 2006 for CAE version 6.6
-    if not basevp:
-        basevp = session.viewports[session.currentViewportName]
-    dg = basevp.odbDisplay.displayGroup
-    primVar = basevp.odbDisplay.primaryVariable
-    varPos = [ UNDEFINED_POSITION, NODAL, INTEGRATION_POINT, ELEMENT_FACE, 
-        ELEMENT_NODAL, WHOLE_ELEMENT, ELEMENT_CENTROID, WHOLE_REGION, 
-        WHOLE_PART_INSTANCE, WHOLE_MODEL, GENERAL_PARTICLE ][primVar[1]]
-    refType = [ NO_REFINEMENT, INVARIANT, COMPONENT ][primVar[4]]
-    deformVar = basevp.odbDisplay.deformedVariable
-    viewCutAttrs = {}
-    for viewCut in basevp.odbDisplay.viewCuts.values():
-        if viewCut.active:
-            attrs = ['motion', 'showModelAboveCut', 
-                    'showModelOnCut', 'showModelBelowCut']
-            if TRANSLATE == viewCut.motion:
-                attrs.append('position')
-            elif ROTATE == viewCut.motion:
-                attrs += ['rotationAxis', 'angle']
-            if CYLINDER == viewCut.shape or SPHERE == viewCut.shape:
-                attrs.append('radius')
-            elif ISOSURFACE == viewCut.shape:
-                attrs.append('value')
-            for attr in attrs:
-                viewCutAttrs[attr] = getattr(viewCut, attr)
-            break   # Found active viewcut
-    for othervp in session.viewports.values():
-        if othervp.name == basevp.name:
-            # Skip this viewport if it is the base viewport
-            continue
-        if othervp.windowState == MINIMIZED:
-            # Ignore minimized viewports
-            continue
-        if hasattr(basevp.odbDisplay, 'display'):
+readOnlyMembers = ('autoDeformationScaleValue', 'autoMaxValue', 'autoMinValue',
+        'name')
+settableTypes = {}  # type name: members which setValues accepted so far
+
+def settableMembers(abaqusObject):
+    """Return names of the plain data members setValues may change
+
+    Subobjects, methods and known read-only members are left out; members
+    which setValues rejects are removed later by copyMembers.
+    """
+    typeName = str(type(abaqusObject))
+    if not settableTypes.has_key(typeName):
+        members = []
+        for name in dir(abaqusObject):
+            if name.startswith('_') or name in readOnlyMembers:
+                continue
+            try:
+                value = getattr(abaqusObject, name)
+            except Exception:
+                continue
+            if not callable(value) and not hasattr(value, 'setValues'):
+                members.append(name)
+        settableTypes[typeName] = members
+    return tuple(settableTypes[typeName])
+
+def memberValues(abaqusObject, names=None):
+    """Return tuple of (name, value) pairs of the settable members of abaqusObject"""
+    if names is None:
+        names = settableMembers(abaqusObject)
+    return tuple([(name, getattr(abaqusObject, name)) for name in names
+        if hasattr(abaqusObject, name)])
+
+def copyMembers(target, members):
+    """Set the (name, value) members of target which differ
+
+    Return True if anything changed. If setValues rejects the members they
+    are set one at a time and those rejected are no longer copied for this
+    type of object.
+    """
+    changed = {}
+    for name, value in members:
+        if getattr(target, name, None) != value:
+            changed[name] = value
+    if not changed:
+        return False
+    try:
+        target.setValues(**changed)
+    except TypeError:
+        settable = settableTypes.get(str(type(target)), [])
+        for name, value in changed.items():
+            try:
+                target.setValues(**{name: value})
+            except TypeError:
+                if name in settable:
+                    settable.remove(name)
+    countChange()
+    return True
+
+cameraMembers = ('cameraPosition', 'cameraTarget', 'cameraUpVector',
+        'width', 'viewOffsetX', 'viewOffsetY')
+viewMembers = ('projection', ) + cameraMembers
+
+class viewportState:
+    """Snapshot of the viewport settings which synchVps copies
+
+    The snapshot is taken once and must not be modified afterwards.
+    """
+    def __init__(self, vp):
+        display = vp.odbDisplay
+        self.name = vp.name
+        self.odbName = display.name
+        self.fieldFrame = display.fieldFrame
+        if hasattr(display, 'display'):
             # CAE version >=6.6
-            othervp.odbDisplay.display.setValues(
-                    plotState=basevp.odbDisplay.display.plotState)
+            self.plotState = display.display.plotState
+            self.plotMode = None
         else:
             # CAE version <6.6
-            othervp.odbDisplay.setPlotMode(basevp.odbDisplay.plotMode)
+            self.plotState = None
+            self.plotMode = display.plotMode
+        self.viewOptions = (
+                ('view', memberValues(vp.view, viewMembers)),
+                ('viewportAnnotationOptions',
+                    memberValues(vp.viewportAnnotationOptions)))
+        self.displayOptions = tuple([(opt, memberValues(getattr(display, opt)))
+            for opt in dir(display) if opt.endswith('Options')])
+        self.displayGroup = display.displayGroup
+        primVar = display.primaryVariable
+        self.primaryVariable = primVar
+        self.outputPosition = [ UNDEFINED_POSITION, NODAL, INTEGRATION_POINT,
+            ELEMENT_FACE, ELEMENT_NODAL, WHOLE_ELEMENT, ELEMENT_CENTROID,
+            WHOLE_REGION, WHOLE_PART_INSTANCE, WHOLE_MODEL,
+            GENERAL_PARTICLE ][primVar[1]]
+        self.refinement = ([ NO_REFINEMENT, INVARIANT, COMPONENT ][primVar[4]],
+                primVar[5])
+        self.deformedVariable = display.deformedVariable
+        self.viewCut = None
+        for viewCut in display.viewCuts.values():
+            if viewCut.active:
+                attrs = ['motion', 'showModelAboveCut',
+                        'showModelOnCut', 'showModelBelowCut']
+                if TRANSLATE == viewCut.motion:
+                    attrs.append('position')
+                elif ROTATE == viewCut.motion:
+                    attrs += ['rotationAxis', 'angle']
+                if CYLINDER == viewCut.shape or SPHERE == viewCut.shape:
+                    attrs.append('radius')
+                elif ISOSURFACE == viewCut.shape:
+                    attrs.append('value')
+                self.viewCut = viewCut
+                self.viewCutGeometry = tuple([(attr, getattr(viewCut, attr))
+                    for attr in ('origin', 'normal', 'axis2')])
+                self.viewCutMembers = tuple([(attr, getattr(viewCut, attr))
+                    for attr in attrs])
+                break   # Found active viewcut
 
-        for opt in ['view', 'viewportAnnotationOptions']:
-            optOther = getattr(othervp, opt)
-            optOther.setValues(getattr(basevp, opt))
-        for opt in [option for option in dir(basevp.odbDisplay) if option.endswith('Options')]:
-            optOther = getattr(othervp.odbDisplay, opt)
-            try:
-                optOther.setValues(getattr(basevp.odbDisplay, opt))
-            except TypeError:
-                pass
-        if othervp.odbDisplay.name == basevp.odbDisplay.name:
-            # Use the same display group if the odbs are the same
-            othervp.odbDisplay.setValues(visibleDisplayGroups=(dg, ))
-        if othervp.odbDisplay.name != basevp.odbDisplay.name or \
-           othervp.odbDisplay.fieldFrame != basevp.odbDisplay.fieldFrame:
-            # Use the same field variables if the frames are different
-            try:
-                othervp.odbDisplay.setDeformedVariable(variableLabel=deformVar[0])
-                othervp.odbDisplay.setPrimaryVariable(variableLabel=primVar[0],
-                    outputPosition=varPos,
-                    refinement=(refType, primVar[5]))
-            except Exception as ex:
-                print(ex)
-
-        if len(viewCutAttrs):
-            if othervp.odbDisplay.viewCuts.has_key(viewCut.name):
-                del(othervp.odbDisplay.viewCuts[viewCut.name])
-            othervc = othervp.odbDisplay.ViewCut(
+    def applyViewCut(self, display):
+        """Update or create the active view cut of display to match"""
+        viewCut = self.viewCut
+        othervc = None
+        if display.viewCuts.has_key(viewCut.name):
+            othervc = display.viewCuts[viewCut.name]
+        if othervc and othervc.shape != viewCut.shape:
+            # Shape cannot be changed so start over
+            del(display.viewCuts[viewCut.name])
+            othervc = None
+        if othervc:
+            copyMembers(othervc, self.viewCutGeometry + self.viewCutMembers)
+            if not othervc.active:
+                display.setValues(viewCutNames=(viewCut.name,), viewCut=ON)
+        else:
+            othervc = display.ViewCut(
                 name=viewCut.name,
                 shape=viewCut.shape,
-                origin=viewCut.origin,
-                normal=viewCut.normal,
-                axis2=viewCut.axis2)
-            othervc.setValues(**viewCutAttrs)
+                **dict(self.viewCutGeometry))
+            othervc.setValues(**dict(self.viewCutMembers))
+
+    def applyFieldVariables(self, display):
+        """Use the same field variables; return False if they do not exist"""
+        if display.primaryVariable == self.primaryVariable and \
+                display.deformedVariable == self.deformedVariable:
+            return True
+        try:
+            display.setDeformedVariable(variableLabel=self.deformedVariable[0])
+            display.setPrimaryVariable(variableLabel=self.primaryVariable[0],
+                outputPosition=self.outputPosition,
+                refinement=self.refinement)
+        except Exception as ex:
+            print(ex)
+            return False
+        return True
+
+    def apply(self, othervp):
+        """Copy the snapshot settings to othervp, skipping unchanged ones"""
+        display = othervp.odbDisplay
+        if self.plotMode is None:
+            if display.display.plotState != self.plotState:
+                display.display.setValues(plotState=self.plotState)
+        else:
+            display.setPlotMode(self.plotMode)
+
+        for opt, members in self.viewOptions:
+            copyMembers(getattr(othervp, opt), members)
+        for opt, members in self.displayOptions:
+            copyMembers(getattr(display, opt), members)
+        if display.name == self.odbName:
+            # Use the same display group if the odbs are the same
+            if display.visibleDisplayGroups != (self.displayGroup, ):
+                display.setValues(visibleDisplayGroups=(self.displayGroup, ))
+
+def synchVps(basevp=None):
+    """ Synchronize all other viewports to the given or current viewport """
+    # Updated Aug 2006 for CAE version 6.6
+    if not basevp:
+        basevp = session.viewports[session.currentViewportName]
+    state = viewportState(basevp)
+
+    viewports = [vp for vp in session.viewports.values()
+            if vp.name != basevp.name and vp.windowState != MINIMIZED]
+    with deferredRedraw(viewports):
+        for othervp in viewports:
+            display = othervp.odbDisplay
+            state.apply(othervp)
+            if display.name != state.odbName or \
+               display.fieldFrame != state.fieldFrame:
+                # Use the same field variables if the frames are different
+                state.applyFieldVariables(display)
+            if state.viewCut:
+                state.applyViewCut(display)
+
+def synchCameras(baseName=None):
+    """ Copy only the camera of the named or current viewport to the others """
+    if not baseName:
+        baseName = session.currentViewportName
+    if not session.viewports.has_key(baseName):
+        return
+    view = session.viewports[baseName].view
+    members = memberValues(view, cameraMembers)
+    viewports = [vp for vp in session.viewports.values()
+            if vp.name != baseName and vp.windowState != MINIMIZED]
+    for othervp in viewports:
+        with deferredRedraw([othervp], counted=True):
+            copyMembers(othervp.view, members)
 
 def swapVps(basevp=None):
     """ Swap the positions of multiple viewports """
@@ -173,90 +338,146 @@ def swapVps(basevp=None):
     viewports.sort(key=lambda vp: vp.origin)    # sort by current position
     state = [(vp.origin, vp.width, vp.height) for vp in viewports]
     state.append(state.pop(0)) # shift the values
-    for vp, (origin, width, height) in zip(viewports, state):
-        vp.setValues(
-                origin=origin,
-                width=width,
-                height=height,
-                )
+    with deferredRedraw(viewports):
+        for vp, (origin, width, height) in zip(viewports, state):
+            vp.setValues(
+                    origin=origin,
+                    width=width,
+                    height=height,
+                    )
+
+def cameraState(view):
+    """Return (position, target, up, width) of the view camera"""
+    return (np.array(view.cameraPosition), np.array(view.cameraTarget),
+            np.array(view.cameraUpVector), view.width)
+
+def playCameraPath(path, viewport=None, fileName=None, format=PNG):
+    """Move the camera through each row of path from cameraMath
+
+    If fileName is given each frame is printed to fileName000, fileName001...
+    """
+    global printingFrames
+    if not viewport:
+        viewport = session.viewports[session.currentViewportName]
+    printingFrames = True   # frames are not saved as userViews
+    try:
+        for frame, row in enumerate(path):
+            viewport.view.setValues(
+                    cameraPosition=tuple(row[0:3]),
+                    cameraTarget=tuple(row[3:6]),
+                    cameraUpVector=tuple(row[6:9]),
+                    width=row[9])
+            if fileName:
+                session.printToFile(fileName='%s%03d'%(fileName, frame),
+                        format=format, canvasObjects=(viewport, ))
+    finally:
+        printingFrames = False
+
+def flyThrough(keyframes, frames=60, viewport=None, fileName=None,
+        format=PNG):
+    """Interpolate the camera through keyframes
+
+    Keyframes are saved userView ids or (position, target, up, width).
+    """
+    cameras = []
+    for keyframe in keyframes:
+        if isinstance(keyframe, basestring):
+            import viewSave
+            camera = viewSave.viewCamera(keyframe)
+            if not camera:
+                print "View %r has no camera."%keyframe
+                return
+            keyframe = camera
+        cameras.append(keyframe)
+    playCameraPath(cameraMath.cameraPath(cameras, frames),
+            viewport, fileName, format)
+
+def turntable(frames=36, viewport=None, fileName=None, format=PNG, axis=None):
+    """Orbit the camera once around its target"""
+    if not viewport:
+        viewport = session.viewports[session.currentViewportName]
+    path = cameraMath.turntablePath(cameraState(viewport.view), frames, axis)
+    playCameraPath(path, viewport, fileName, format)
 
 def viewCutNormal(viewport=None):
     """Orient the view to be perpendicular to the active cutting plane."""
     viewport, display = getViewportDisplay(viewport)
-    for viewCut in display.viewCuts.values():
-        if not viewCut.active:
-            continue
-        if viewCut.shape != PLANE:
-            continue # throw an error here?
-        if hasattr(viewCut, 'csysName') and viewCut.csysName:
-            # Find the csys which defines this cut
-            scratchOdb = session.scratchOdbs[display.name]
-            csys = scratchOdb.rootAssembly.datumCsyses[viewCut.csysName]
-            if csys.type != CARTESIAN:
+    with deferredRedraw([viewport]):
+        for viewCut in display.viewCuts.values():
+            if not viewCut.active:
+                continue
+            if viewCut.shape != PLANE:
                 continue # throw an error here?
-            origin = csys.origin
-            if AXIS_1 == viewCut.normal:
-                normal = csys.xAxis
-                axis2 = csys.yAxis
-            elif AXIS_2 == viewCut.normal:
-                normal = csys.yAxis
-                axis2 = csys.zAxis
-            else:
-                normal = csys.zAxis
-                axis2 = csys.xAxis
-        else:
-            # cut is defined by points
-            origin = np.array(viewCut.origin)
-            normal = np.array(viewCut.normal)
-            axis2 = np.array(viewCut.axis2)
-
-        if viewCut.motion == ROTATE:
-            # cut is rotated by some angle
-            if viewCut.rotationAxis == AXIS_2:
-                normal = rotateVector(normal, axis2, viewCut.angle*np.pi/180)
+            if hasattr(viewCut, 'csysName') and viewCut.csysName:
+                # Find the csys which defines this cut
+                scratchOdb = session.scratchOdbs[display.name]
+                csys = scratchOdb.rootAssembly.datumCsyses[viewCut.csysName]
+                if csys.type != CARTESIAN:
+                    continue # throw an error here?
+                origin = csys.origin
+                if AXIS_1 == viewCut.normal:
+                    normal = csys.xAxis
+                    axis2 = csys.yAxis
+                elif AXIS_2 == viewCut.normal:
+                    normal = csys.yAxis
+                    axis2 = csys.zAxis
+                else:
+                    normal = csys.zAxis
+                    axis2 = csys.xAxis
             else:
-                axis3 = np.cross(normal, axis2)
-                normal = rotateVector(normal, axis3, viewCut.angle*np.pi/180)
-                axis2 = np.cross(axis3, normal)
+                # cut is defined by points
+                origin = np.array(viewCut.origin)
+                normal = np.array(viewCut.normal)
+                axis2 = np.array(viewCut.axis2)
 
-        if viewCut.showModelAboveCut and not viewCut.showModelBelowCut:
-            # look at the back of the cut
-            normal = -1*normal
-            axis2 = -1*axis2
+            if viewCut.motion == ROTATE:
+                # cut is rotated by some angle
+                if viewCut.rotationAxis == AXIS_2:
+                    normal = rotateVector(normal, axis2, viewCut.angle*np.pi/180)
+                else:
+                    axis3 = np.cross(normal, axis2)
+                    normal = rotateVector(normal, axis3, viewCut.angle*np.pi/180)
+                    axis2 = np.cross(axis3, normal)
 
-        target = viewport.view.cameraTarget
-        dist = norm(np.array(viewport.view.cameraPosition) - target)
+            if viewCut.showModelAboveCut and not viewCut.showModelBelowCut:
+                # look at the back of the cut
+                normal = -1*normal
+                axis2 = -1*axis2
 
-        viewport.view.setValues(
-                #cameraTarget=origin,
-                cameraPosition=target + dist*normal/norm(normal),
-                cameraUpVector=np.cross(normal, axis2))
+            target = viewport.view.cameraTarget
+            dist = norm(np.array(viewport.view.cameraPosition) - target)
 
-        break   # stop searching for the active view cut
+            viewport.view.setValues(
+                    #cameraTarget=origin,
+                    cameraPosition=target + dist*normal/norm(normal),
+                    cameraUpVector=np.cross(normal, axis2))
+
+            break   # stop searching for the active view cut
 
 def viewCutDatum(datum, cutName="DatumCut"):
     """Create a view cut from a datum plane"""
     viewport, display = getViewportDisplay()
-    origin = np.asarray(datum.pointOn)
-    normal = np.asarray(datum.normal)
-    for v in (0,1,0), (0,0,1), (1,0,0):
-        if abs(np.dot(v, normal)) < 0.5: # Dissimilar directions
-            break
-    if display.viewCuts.has_key(cutName):
-        viewCut = display.viewCuts[cutName]
-        viewCut.setValues(
-            origin = origin,
-            normal = normal,
-            axis2 = np.cross(v, normal) )
-    else:
-        viewCut = display.ViewCut(
-            name = cutName,
-            shape = PLANE,
-            origin = origin,
-            normal = normal,
-            axis2 = np.cross(v, normal) )
-    viewCut.setValues(motion=TRANSLATE, position=0)
-    display.setValues(activeCutName=cutName, viewCut=ON)
+    with deferredRedraw([viewport]):
+        origin = np.asarray(datum.pointOn)
+        normal = np.asarray(datum.normal)
+        for v in (0,1,0), (0,0,1), (1,0,0):
+            if abs(np.dot(v, normal)) < 0.5: # Dissimilar directions
+                break
+        if display.viewCuts.has_key(cutName):
+            viewCut = display.viewCuts[cutName]
+            viewCut.setValues(
+                origin = origin,
+                normal = normal,
+                axis2 = np.cross(v, normal) )
+        else:
+            viewCut = display.ViewCut(
+                name = cutName,
+                shape = PLANE,
+                origin = origin,
+                normal = normal,
+                axis2 = np.cross(v, normal) )
+        viewCut.setValues(motion=TRANSLATE, position=0)
+        display.setValues(activeCutName=cutName, viewCut=ON)
 
 def viewCutPoint(point):
     """Adjust current viewCut to pass through given point"""
@@ -291,10 +512,11 @@ def viewSteps():
         session.Viewport(name='Viewport: %d'%viewid)
     sortednames = session.viewports.keys()
     sortednames.sort()
-    for (step, vpname) in zip(steps, sortednames):
-        viewport=session.viewports[vpname]
-        viewport.setValues(displayedObject=currentOdb)
-        viewport.odbDisplay.setFrame(step.frames[-1])
+    with deferredRedraw():
+        for (step, vpname) in zip(steps, sortednames):
+            viewport=session.viewports[vpname]
+            viewport.setValues(displayedObject=currentOdb)
+            viewport.odbDisplay.setFrame(step.frames[-1])
 
 def viewOdbs():
     """ Create and assign a separate viewport for each open odb. """
@@ -303,9 +525,10 @@ def viewOdbs():
         while session.viewports.has_key('Viewport: %d'%viewid):
             viewid += 1
         session.Viewport(name='Viewport: %d'%viewid)
-    for (odb, viewport) in zip(
-            session.odbs.values(), session.viewports.values()):
-        viewport.setValues(displayedObject=odb)
+    with deferredRedraw():
+        for (odb, viewport) in zip(
+                session.odbs.values(), session.viewports.values()):
+            viewport.setValues(displayedObject=odb)
 
 def tileVertical():
     """ Arrange visible viewports side-by-side """
@@ -314,48 +537,50 @@ def tileVertical():
     viewports.sort(key=lambda vp: vp.origin)    # sort by current position
     da = session.drawingArea
     width = da.width/len(viewports)
-    previousvp = None
-    for i, vp in enumerate(viewports):
-        vp.restore()    # ensure windowState is NORMAL (not MAXIMIZED)
-        vp.setValues(height = da.height, width = width,
-                origin=(i*width + da.origin[0], da.origin[1]))
-        # default annotation options
-        triad = OFF
-        compass = OFF
-        legend = ON
-        title = ON
-        state = ON
-        if previousvp and hasattr(previousvp.odbDisplay, 'fieldFrame') and hasattr(vp.odbDisplay, 'fieldFrame'):
-            if previousvp.displayedObject == vp.displayedObject:
-                title = OFF
-                if previousvp.odbDisplay.fieldFrame == vp.odbDisplay.fieldFrame:
-                    state = OFF
-            legend = previousvp.odbDisplay.primaryVariable != vp.odbDisplay.primaryVariable
-            co0 = previousvp.odbDisplay.contourOptions
-            co1 = vp.odbDisplay.contourOptions
-            for attr in ('maxAutoCompute', 'minAutoCompute', 'contourType',
-                    'numIntervals', 'intervalType', 'maxValue', 'minValue'):
-                legend |= getattr(co0, attr) != getattr(co1, attr)
-            legend |= co0.minAutoCompute | co0.maxAutoCompute
-
-        vp.viewportAnnotationOptions.setValues(
-                triad=triad,
-                compass=compass,
-                legend=legend,
-                title=title,
-                state=state)
-        previousvp = vp
-    # special treatment for rightmost viewport
-    previousvp.viewportAnnotationOptions.setValues(
-            triad=ON, compass=ON)
+    with deferredRedraw(viewports):
+        previousvp = None
+        for i, vp in enumerate(viewports):
+            vp.restore()    # ensure windowState is NORMAL (not MAXIMIZED)
+            vp.setValues(height = da.height, width = width,
+                    origin=(i*width + da.origin[0], da.origin[1]))
+            # default annotation options
+            triad = OFF
+            compass = OFF
+            legend = ON
+            title = ON
+            state = ON
+            if previousvp and hasattr(previousvp.odbDisplay, 'fieldFrame') and hasattr(vp.odbDisplay, 'fieldFrame'):
+                if previousvp.displayedObject == vp.displayedObject:
+                    title = OFF
+                    if previousvp.odbDisplay.fieldFrame == vp.odbDisplay.fieldFrame:
+                        state = OFF
+                legend = previousvp.odbDisplay.primaryVariable != vp.odbDisplay.primaryVariable
+                co0 = previousvp.odbDisplay.contourOptions
+                co1 = vp.odbDisplay.contourOptions
+                for attr in ('maxAutoCompute', 'minAutoCompute', 'contourType',
+                        'numIntervals', 'intervalType', 'maxValue', 'minValue'):
+                    legend |= getattr(co0, attr) != getattr(co1, attr)
+                legend |= co0.minAutoCompute | co0.maxAutoCompute
+
+            vp.viewportAnnotationOptions.setValues(
+                    triad=triad,
+                    compass=compass,
+                    legend=legend,
+                    title=title,
+                    state=state)
+            previousvp = vp
+        # special treatment for rightmost viewport
+        previousvp.viewportAnnotationOptions.setValues(
+                triad=ON, compass=ON)
 
 def resetLayerTransform(viewport=None):
     """Set layer view transforms to something sane (no transform)"""
     if not viewport:
         viewport = session.viewports[session.currentViewportName]
-    for layer in viewport.layers.values():
-        layer.view.setLayerTransform(layerTransform=(1, 0, 0, 0,
-                                                     0, 1, 0, 0,
-                                                     0, 0, 1, 0,
-                                                     0, 0, 0, 1))
+    with deferredRedraw([viewport]):
+        for layer in viewport.layers.values():
+            layer.view.setLayerTransform(layerTransform=(1, 0, 0, 0,
+                                                         0, 1, 0, 0,
+                                                         0, 0, 1, 0,
+                                                         0, 0, 0, 1))
 
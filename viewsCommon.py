@@ -3,6 +3,18 @@
 """
 # $Id$
 
+import os
+
 __version__ = 0.54
 xmlFileName = 'userViews.xml'
+schemaFileName = os.path.join(os.path.expanduser('~'), '.userViewsSchema')
+journalLimit = 1 << 20  # bytes of journal before compaction, 0 to disable
+
+thumbnailDirectory = os.path.join(os.path.expanduser('~'), '.userViewsThumbs')
+thumbnailSize = (160, 120)  # pixels
+thumbnailIconSize = (24, 18)    # pixels of the thumbnails in the table rows
+thumbnailMemory = 1 << 22   # bytes of thumbnails kept in memory by the GUI
 
+planCacheEntries = 50       # decoded views kept for quick restore
+planCacheMemory = 1 << 24   # approximate bytes of decoded views kept
+prefetchCount = 8           # views decoded ahead of the Views Manager selection
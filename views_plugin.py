@@ -87,6 +87,107 @@ toolset.registerKernelMenuButton(
         description='Set layer transforms to 1')
 
 
+class viewLinkForm(AFXForm):
+    """Keep the other viewports synchronized with the current one
+
+    Activating the form toggles the link. Queries on the base viewport
+    schedule an update; updates are coalesced so at most one command is
+    sent per updateDelay and the kernel applies only the latest state.
+    """
+    (
+        ID_TIMEOUT,
+        ID_LAST,
+    ) = range(AFXForm.ID_LAST, AFXForm.ID_LAST + 2)
+
+    updateDelay = 100   # ms between updates sent to the kernel
+    optionPaths = ('viewportAnnotationOptions', 'odbDisplay',
+            'odbDisplay.display', 'odbDisplay.commonOptions',
+            'odbDisplay.contourOptions', 'odbDisplay.symbolOptions',
+            'odbDisplay.superimposeOptions')
+
+    def __init__(self, owner):
+        AFXForm.__init__(self, owner) # Construct the base class.
+        self.baseName = None
+        self.queries = []   # (object, subroutine) pairs to unregister
+        self.pending = None     # None, 'camera' or 'options'
+        FXMAPFUNC(self, SEL_TIMEOUT, self.ID_TIMEOUT, viewLinkForm.onTimeout)
+
+    def activate(self):
+        "Menu button was pushed - toggle the link"
+        mainWindow = getAFXApp().getAFXMainWindow()
+        if self.baseName:
+            self.unlink()
+            mainWindow.writeToMessageArea('Viewports unlinked.')
+        else:
+            self.link(getCurrentContext()['viewportName'])
+            mainWindow.writeToMessageArea(
+                    'Viewports linked to %s.'%self.baseName)
+
+    def link(self, baseName):
+        "Register queries on the base viewport and synchronize once"
+        self.baseName = baseName
+        vp = session.viewports[baseName]
+        self.addQuery(vp.view, self.onCamera)
+        for path in self.optionPaths:
+            obj = vp
+            for name in path.split('.'):
+                obj = getattr(obj, name)
+            self.addQuery(obj, self.onOptions)
+        self.schedule('options')
+
+    def unlink(self):
+        "Unregister all queries and forget any pending update"
+        for obj, subroutine in self.queries:
+            try:
+                obj.unregisterQuery(subroutine)
+            except Exception:
+                pass    # base viewport may have been deleted
+        self.queries = []
+        self.baseName = None
+        self.pending = None
+        getAFXApp().removeTimeout(self, self.ID_TIMEOUT)
+
+    def addQuery(self, obj, subroutine):
+        obj.registerQuery(subroutine, False)
+        self.queries.append( (obj, subroutine) )
+
+    def onCamera(self):
+        "Base viewport view changed"
+        self.schedule('camera')
+
+    def onOptions(self):
+        "Base viewport display options changed"
+        self.schedule('options')
+
+    def schedule(self, kind):
+        "Request an update; the full options sync includes the camera"
+        if not self.pending:
+            getAFXApp().addTimeout(self, self.ID_TIMEOUT, self.updateDelay)
+        if 'options' != self.pending:
+            self.pending = kind
+
+    def onTimeout(self, sender, sel, ptr):
+        "Send the latest pending update to the kernel"
+        pending, self.pending = self.pending, None
+        if not self.baseName:
+            return 0
+        if 'options' == pending:
+            sendCommand("views.synchVps(session.viewports[%r])"%self.baseName)
+        elif 'camera' == pending:
+            sendCommand("views.synchCameras(%r)"%self.baseName)
+        return 0
+
+toolset.registerGuiMenuButton(
+        buttonText='&Views|&Link viewports',
+        object=viewLinkForm(toolset),
+        kernelInitString='import views',
+        author='Carl Osterwisch',
+        version='0.1',
+        applicableModules=['Visualization'],
+        description='Toggle continuous synchronization with the current viewport.'
+        )
+
+
 class viewCutDatumProcedure(AFXProcedure):
     def __init__(self, owner):
         # Construct the base class